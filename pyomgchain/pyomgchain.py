@@ -30,15 +30,25 @@ __version__ = f'pyomgchain (pyomgchain-{VERSION}) [{SAS_RELEASE}-{SAS_AKA}]'
 import os
 import datetime
 import sys
-import glob
 import pysas.pyutils.pyutils as pyutils
 import logging
 import subprocess
 import re
-import fnmatch
 import time
+import concurrent.futures
+import functools
+import numpy as np
 
 
+logger = logging.getLogger('pyomgchain')
+
+# Position, size and processing flag of the windows of an exposure.
+window_dtype = np.dtype([('win', 'U8'), ('wx0', 'i4'), ('wy0', 'i4'), ('wdx', 'i4'), ('wdy', 'i4'), ('proc', 'i1')])
+
+# Name of an OM image file, e.g. 0070_0125320701_OMS00600IMI.FIT, with the
+# orbit, obsid, exposure and window as groups.
+imi_file_pattern = re.compile(r'^(.{4}).(.{10}).{4}(.{3})(.{2})IMI\.FIT$')
+
 
 def process_orbit(orbit_key, has_ff, ff_name):
     """
@@ -50,23 +60,58 @@ def process_orbit(orbit_key, has_ff, ff_name):
         ff_name: the name of the flat field flag.
     """
 
+    process_exposures(orbit_exposures(orbit_key, has_ff, ff_name))
+
+
+def orbit_exposures(orbit_key, has_ff, ff_name):
+    """
+    Lists the exposures to process in an orbit.
+
+    Args:
+        orbit_key: the orbit to process.
+        has_ff: the flat field flag.
+        ff_name: the name of the flat field flag.
+
+    Output:
+        exposures: list of (orbit, obsid, exposure, flat field file) tuples, the arguments of process_exposure.
+    """
+
     highlighted_message('*', '    Processing orbit {}'.format(orbit_key))
 
-    global flat_field_filename
+    exposures = []
     for obs in obs_list.keys():
         Message('     Observation {}'.format(obs))
         if has_ff:
             Message('Using flatfield (hasff = {})'.format(has_ff))
-            Message('ff_name = {}'.format(ff_name))
+            Debug('ff_name = {}', ff_name)
             flat_field_filename = ff_name
         else:
             flat_field_filename = ''
 
         for exp_key in sorted(exp_list.keys()):
-            process_exposure(orbit_key, obs, exp_key)
+            exposures.append((orbit_key, obs, exp_key, flat_field_filename))
+
+    return exposures
 
 
-def process_exposure(orb_key, obs_key, exp_key):
+def process_exposures(exposures):
+    """
+    Processes a list of exposures concurrently. The exposures are independent
+    and the work is done by the SAS tasks running as subprocesses, so threads
+    are enough to keep them busy.
+
+    Args:
+        exposures: list of (orbit, obsid, exposure, flat field file) tuples, as given by orbit_exposures.
+    """
+
+    if not exposures:
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = min(os.cpu_count() or 1, len(exposures))) as executor:
+        list(executor.map(lambda exposure: process_exposure(*exposure), exposures))
+
+
+def process_exposure(orb_key, obs_key, exp_key, flat_field_filename):
     """
     Processes a single exposure.
 
@@ -75,112 +120,71 @@ def process_exposure(orb_key, obs_key, exp_key):
         orb_key: orbit key
         obs_key: the observation key
         exp_key: the exposure.
+        flat_field_filename: the flat field file, empty if none is used.
     """
 
-    vis_win = dict()
-    vis_wx0 = dict()
-    vis_wy0 = dict()
-    vis_wdx = dict()
-    vis_wdy = dict()
-    vis_proc = dict()
-
-    uv_win = dict()
-    uv_wx0 = dict()
-    uv_wy0 = dict()
-    uv_wdx = dict()
-    uv_wdy = dict()
-    uv_proc = dict()
+    vis_windows = np.empty(len(win_list), dtype = window_dtype)
+    uv_windows = np.empty(len(win_list), dtype = window_dtype)
 
     message = '     Exposure: {}'.format(exp_key)
     highlighted_message('*', message)
 
-    tracking_history_flag = 0
-    window_file_flag =0
-
-    if fnmatch.filter(list_of_files, orb_key + obs_key + exp_key + '*00THX*'):
-        tracking_history_flag = 1
-        tracking_history_filename = fnmatch.filter(list_of_files, orb_key + obs_key + exp_key + '*00THX*')[0]
-    else:
-        tracking_history_flag = 0
+    tracking_history_filename = find_file(orb_key, obs_key, exp_key, '00', 'THX')
+    window_data_filename = find_file(orb_key, obs_key, exp_key, '00', 'WDX')
+    periodic_hk_filename = find_file(orb_key, obs_key, '000', '00', 'PEH')
+    non_periodic_hk_filename = find_file(orb_key, obs_key, '000', '00', 'NPH')
 
-    if tracking_history_flag:
+    if tracking_history_filename:
         Message('Tracking hisotry flag: Ok')
     else:
+        # The grism tasks do not use the tracking history, so the exposure
+        # can still be processed without it.
         Message('Tracking history filename file for {} is missing.'.format(exp_key))
 
-        SAS_dir = os.environ['SAS_DIR']
-        Message('Creating a dummy file for tracking history.')
-        tracking_history_filename = 'DUMMYTHX.FIT'
-
-    global window_data_filename
-    if fnmatch.filter(list_of_files, orb_key + obs_key + exp_key + '*00WDX*'):
-        window_file_flag = 1
-        window_data_filename = fnmatch.filter(list_of_files, orb_key + obs_key + exp_key + '*00WDX*')[0]
-    else:
-        window_data_flag = 0
-    if window_file_flag:
+    if window_data_filename:
         Message('Window data file: o.k')
     else:
         Message('Window data file for the exposure {} is missing.'.format(exp_key))
 
-    f1 = '*' + orb_key + '*' + obs_key + '*' + exp_key + '*00WDX*'
-    f2 = '*' + orb_key + '*' + obs_key + '*OM*00000NPH*'
-    f3 = '*' + orb_key + '*' + obs_key + '*OM*00000PEH*'
-
-    if fnmatch.filter(list_of_files, f1) and fnmatch.filter(list_of_files, f2) and fnmatch.filter(list_of_files, f3):
-        global periodic_hk_filename, non_periodic_hk_filename
-        periodic_hk_filename = fnmatch.filter(list_of_files, f3)[0]
-        non_periodic_hk_filename = fnmatch.filter(list_of_files, f2)[0]
-        window_data_filename = fnmatch.filter(list_of_files, f1)[0]
-
+    if all((window_data_filename, non_periodic_hk_filename, periodic_hk_filename)):
         s = window_data_filename[18] # takes the letter for the mode
         tracking_history_plot_filename = 'P' + obs_key + 'OM' + s + exp_key + 'TSHPLT' + '0000.PS'
-        Message('Tracking history plot file: {}'.format(tracking_history_plot_filename))
+        Debug('Tracking history plot file: {}', tracking_history_plot_filename)
 
         s = non_periodic_hk_filename[18] # takes the letter for the mode
         tracking_history_timeseries_filename = 'P' + obs_key + 'OM' + s + exp_key + 'TSTRTS0000.FIT'
-        Message('Tracking history timeseries file: {}'.format(tracking_history_timeseries_filename))
+        Debug('Tracking history timeseries file: {}', tracking_history_timeseries_filename)
+
+        odf_files = (flat_field_filename, window_data_filename, periodic_hk_filename, non_periodic_hk_filename)
 
         number_of_grisms = 0
         vis_index = 0
         uv_index = 0
 
-        for i in sorted(win_list.keys()):
-            win_key = i
-            if fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + win_key + '*IMI*')[0]:
-                image_file = inp_dir + '/' + fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + win_key + '*IMI*')[0]
-                if os.path.isfile(image_file):
-                    Message('Image found: {}'.format(image_file))
-
-                filter_id = pyutils.get_key_word(image_file, 'FILTER')
-                wx0 = pyutils.get_key_word(image_file, 'WINDOWX0')
-                wy0 = pyutils.get_key_word(image_file, 'WINDOWY0')
-                wdx = pyutils.get_key_word(image_file, 'WINDOWDX')
-                wdy = pyutils.get_key_word(image_file, 'WINDOWDY')
-
-                if filter_id == 200:
-                    vis_win.update({vis_index : win_key})
-                    vis_wx0.update({vis_index : wx0})
-                    vis_wy0.update({vis_index : wy0})
-                    vis_wdx.update({vis_index : wdx})
-                    vis_wdy.update({vis_index : wdy})
-                    vis_proc.update({vis_index : 1})
-                    vis_index = vis_index + 1
-
-                if filter_id == 1000:
-                    uv_win.update({uv_index : win_key})
-                    uv_wx0.update({uv_index : wx0})
-                    uv_wy0.update({uv_index : wy0})
-                    uv_wdx.update({uv_index : wdx})
-                    uv_wdy.update({uv_index : wdy})
-                    uv_proc.update({uv_index : 1})
-                    uv_index = uv_index + 1
+        for win_key in sorted(win_list.keys()):
+            imi_filename = find_file(orb_key, obs_key, exp_key, win_key, 'IMI')
+            if not imi_filename:
+                continue
+
+            image_file = inp_dir + '/' + imi_filename
+            Debug('Image found: {}', image_file)
+
+            filter_id, wx0, wy0, wdx, wdy = pyutils.get_key_words(image_file,
+                ('FILTER', 'WINDOWX0', 'WINDOWY0', 'WINDOWDX', 'WINDOWDY'))
+
+            if filter_id == 200:
+                vis_windows[vis_index] = (win_key, wx0, wy0, wdx, wdy, 1)
+                vis_index = vis_index + 1
+
+            if filter_id == 1000:
+                uv_windows[uv_index] = (win_key, wx0, wy0, wdx, wdy, 1)
+                uv_index = uv_index + 1
 
         if vis_index > 0:
-            process_windows(orb_key, obs_key, exp_key, filter_id, vis_index, vis_win, vis_wx0, vis_wy0, vis_wdx, vis_wdy, vis_proc)
+            process_windows(orb_key, obs_key, exp_key, 200, vis_windows[:vis_index], odf_files)
 
         if uv_index > 0:
-            process_windows(orb_key, obs_key, exp_key, filter_id, uv_index, uv_win, uv_wx0, uv_wy0, uv_wdx, uv_wdy, uv_proc)
+            process_windows(orb_key, obs_key, exp_key, 1000, uv_windows[:uv_index], odf_files)
 
     else:
         Message('*** Warning ***')
@@ -199,6 +203,40 @@ def process_exposure(orb_key, obs_key, exp_key):
         Message('Please check if the file {} is in the ODF'.format(wdx_file))
 
 
+def run_sas_task(task, arg_list):
+    """
+    Runs a SAS task directly, without going through a shell.
+
+    Args:
+        task: the name of the task.
+        arg_list: list with the arguments of the task, as 'parameter=value' strings.
+
+    Output:
+        the exit status of the task.
+    """
+
+    Message('{} {}'.format(task, ' '.join(arg_list)))
+
+    return subprocess.run([task] + arg_list).returncode
+
+
+def convert_ps_to_pdf(ps_file, pdf_file):
+    """
+    Starts the conversion of a PostScript file to PDF. Ghostscript is called
+    directly, rather than through the ps2pdf wrapper scripts.
+
+    Args:
+        ps_file: the PostScript file.
+        pdf_file: the PDF file to produce.
+
+    Output:
+        the running process; its wait() method returns the exit status.
+    """
+
+    return subprocess.Popen(['gs', '-q', '-dSAFER', '-dBATCH', '-dNOPAUSE', '-sDEVICE=pdfwrite',
+        '-dCompatibilityLevel=1.4', f'-sOutputFile={pdf_file}', ps_file])
+
+
 def Message(message):
     """
     Prints a message directly to the screen and sends it to a log file.
@@ -207,10 +245,25 @@ def Message(message):
         message: the message to send to the log and screen.
     """
 
-    logging.basicConfig(filename = 'pyomgchain.log', level = logging.DEBUG)
-
     print(message)
-    logging.info(message)
+    logger.info(message)
+
+
+def Debug(message, *args):
+    """
+    Prints a diagnostic message to the screen and sends it to the log file,
+    only when debugging output is enabled (SAS_VERBOSITY >= 8). The message
+    is not formatted otherwise.
+
+    Args:
+        message: the message, possibly with {} fields.
+        args: the values for the fields of the message.
+    """
+
+    if logger.isEnabledFor(logging.DEBUG):
+        message = message.format(*args)
+        print(message)
+        logger.debug(message)
 
 
 def highlighted_message(character, message):
@@ -224,42 +277,35 @@ def highlighted_message(character, message):
     """
 
     message = message.split('\n')
-    num_lines = len(message)
-    max_lenght = len(message[0])
-
-    if num_lines > 1:
-        for i in range(1, num_lines):
-            if len(message[i]) > max_lenght:
-                max_lenght == len(message[i])
+    max_lenght = max(len(line) for line in message)
 
-    text = ''
-    for i in range(0, max_lenght):
-        text = text + character
+    text = character * max_lenght
     Message(text)
 
-    for i in range(0, num_lines):
-        Message(message[i])
+    for line in message:
+        Message(line)
 
     Message(text)
 
 
+@functools.lru_cache(maxsize = None)
 def get_ODF_directory(SASfile):
     """
-    Returns the ODF directory.
+    Returns the ODF directory, taken from the first PATH line of the summary file.
 
     Args:
         SAS_file: the .SAS summary file.
     
     Output: 
-        directory: the ODF directory as a string.
+        directory: the ODF directory as a string. Empty if the file has no PATH line.
     """
 
     with open (SASfile, 'r') as SAS_file:
         for line in SAS_file:
             if 'PATH' in line:
-                directory = line[5:]
+                return line[5:]
 
-    return directory
+    return ''
 
 
 def check_for_house_keeping_files(list_of_files):
@@ -302,6 +348,40 @@ def check_for_house_keeping_files(list_of_files):
     return (periodic_hk_filename, non_periodic_hk_filename)
 
 
+def find_SAS_file(directory):
+    """
+    Returns the first .SAS summary file found in a directory.
+
+    Args:
+        directory: the directory to search.
+
+    Output:
+        the name of the SAS summary file, or None if there is none.
+    """
+
+    with os.scandir(directory) as entries:
+        return next((entry.name for entry in entries if entry.name.endswith('.SAS')), None)
+
+
+def find_FIT_files(directory):
+    """
+    Returns the names of the FIT files in a directory, read in a single pass
+    over the directory entries. The names are returned without the path.
+
+    Args:
+        directory: the directory to search.
+
+    Output:
+        list_of_files: the list of file names, sorted.
+    """
+
+    with os.scandir(directory) as entries:
+        list_of_files = [entry.name for entry in entries
+                         if entry.name.endswith('FIT') and not entry.name.startswith('.') and entry.is_file()]
+
+    return sorted(list_of_files)
+
+
 def set_up_directory_paths():
     """
     Prepares some basic directories into global variables, if not already present.
@@ -327,7 +407,7 @@ def set_up_directory_paths():
         if not 'SAS_ODF' in os.environ or os.environ['SAS_ODF'] == '':
             inp_dir = os.getcwd()
             os.environ['SAS_ODF'] = inp_dir
-            SAS_file = glob.glob('*.SAS')[0]
+            SAS_file = find_SAS_file(inp_dir)
 
         else:
             pos = os.environ['SAS_ODF'].index('SAS')
@@ -336,7 +416,7 @@ def set_up_directory_paths():
                 inp_dir = get_ODF_directory(SAS_file).rstrip()
             else:
                 inp_dir = os.environ['SAS_ODF'].rstrip()
-                SAS_file = glob.glob(inp_dir + '*.SAS')[0]
+                SAS_file = find_SAS_file(inp_dir)
     else:
         if os.path.isdir(inpdirectory):
             inp_dir = inpdirectory
@@ -357,7 +437,7 @@ def set_up_directory_paths():
     return(has_ff, ff_name, inp_dir, out_dir)
 
 
-def process_windows(orb_key, obs_key, exp_key, filter_id, index, mixed_win, mixed_wx0, mixed_wy0, mixed_wdx, mixed_wdy, mixed_proc):
+def process_windows(orb_key, obs_key, exp_key, filter_id, windows, odf_files):
     """
     Don't mistake this with process_window. Evaluates the windows that are in each exposure.
     Args:
@@ -365,17 +445,17 @@ def process_windows(orb_key, obs_key, exp_key, filter_id, index, mixed_win, mixe
         obs_key: current orbit key.
         exp_key: current exposure key.
         filter_id: the id of the filter for the exposure.'
-        index: value for index taken from the exposure.
-        mixed_win: the mixed value for the window.
-        mixed_wx0, mixed_wy0, mixed_wdx, mixed_wdy, mixed_proc: mixed values taken from the fits from the exposure.
+        windows: structured array (see window_dtype) with the windows of the exposure taken with this filter.
+        odf_files: (flat field, window data, periodic and non periodic housekeeping) files of the exposure.
     """
 
-    win = mixed_win
-    wx0 = mixed_wx0
-    wy0 = mixed_wy0
-    wdx = mixed_wdx
-    wdy = mixed_wdy
-    proc = mixed_proc
+    index = len(windows)
+    win = windows['win'].tolist()
+    wx0 = windows['wx0']
+    wy0 = windows['wy0']
+    wdx = windows['wdx']
+    wdy = windows['wdy']
+    proc = windows['proc']
     comb_list = dict()
 
     message_filter = 'filter value does not correspond to a grism'
@@ -401,40 +481,45 @@ def process_windows(orb_key, obs_key, exp_key, filter_id, index, mixed_win, mixe
             Message(message_window)
 
             icomb = 0
-            comb_list = list(win.values())
+            comb_list = list(win)
 
             # Combine images only if the parameter $combine is yes
             if combine:
                 j = i
                 Message('Combine = yes')
-                while j < (index - 1):
-                    j = j + 1
-                    if wx0[j] == (wx_edge + dx_edge) and wy0[j] == wy_edge and wdy[j] == dy_edge:
-                        icomb = icomb + 1
-                        comb_list[icomb] = win[j]
-                        wx_edge = wx_edge + dx_edge
-                        dx_edge = wdx[j]
-                        wy_edge = wy0[j]
-                        dy_edge = wdy[j]
-                        proc[j] = -1
+                # Look for the next window adjacent to the right edge of the
+                # combined image among the remaining ones, all at once.
+                while True:
+                    adjacent = np.flatnonzero((wx0[j + 1:] == wx_edge + dx_edge) &
+                        (wy0[j + 1:] == wy_edge) & (wdy[j + 1:] == dy_edge))
+                    if len(adjacent) == 0:
+                        break
+                    j = j + 1 + adjacent[0]
+                    icomb = icomb + 1
+                    comb_list[icomb] = win[j]
+                    wx_edge = wx_edge + dx_edge
+                    dx_edge = wdx[j]
+                    wy_edge = wy0[j]
+                    dy_edge = wdy[j]
+                    proc[j] = -1
 
                 k = 0
                 # Check if the input files exist:
                 while k <= icomb:
-                    f = orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[k] + "*IMI*"
-                    if fnmatch.filter(list_of_files, f):
-                        input_image_filename = fnmatch.filter(list_of_files, f)[0]
+                    image_filename = find_file(orb_key, obs_key, exp_key, comb_list[k], 'IMI')
+                    if image_filename:
+                        input_image_filename = image_filename
                     k = k + 1
 
             k = len(comb_list)
-            process_window(orb_key, obs_key, exp_key, comb_list)
+            process_window(orb_key, obs_key, exp_key, filter_id, comb_list, odf_files)
 
         else:
             Message("The window {} is in the combined list and will not be processed ".format(win[i]))
         i = i + 1
 
 
-def process_window(orb_key, obs_key, exp_key, comb_list):
+def process_window(orb_key, obs_key, exp_key, filter_id, comb_list, odf_files):
     """
     Processes a single window of the observation.
 
@@ -442,9 +527,13 @@ def process_window(orb_key, obs_key, exp_key, comb_list):
         orb_key: the current orbital key.
         obs_key: the current observation key.
         exp_key: the current exposition key.
+        filter_id: the id of the grism filter of the windows (200 or 1000).
         comb_list: the combination list for windoes.
+        odf_files: (flat field, window data, periodic and non periodic housekeeping) files of the exposure.
     """
 
+    flat_field_filename, window_data_filename, periodic_hk_filename, non_periodic_hk_filename = odf_files
+
     exposure_image_list = []
     n_win = len(comb_list)
     combined_file_name = "g" + obs_key + "OMS" + exp_key + "CIMAGE0000.FIT"
@@ -454,26 +543,21 @@ def process_window(orb_key, obs_key, exp_key, comb_list):
     Message('Number of sub-windows found: {}'.format(n_win))
 
     if combine and n_win == 4:
-        k = 0
-        while k <= n_win:
-            f = orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[k] + "*IMI*"
-            if fnmatch.filter(list_of_files, f):
-                exposure_image_list.append(inp_dir + '/' + fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[k] + '*IMI*')[0])
-                mode_symbol = fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[k] + '*IMI*')[0][18]
-                combined_filename = 'g' + obs_key + 'OM' + mode_symbol + exp_key + 'CIMAGE0000.FIT'
-                k = k + 1
+        for win_key in comb_list:
+            image_filename = find_file(orb_key, obs_key, exp_key, win_key, 'IMI')
+            if not image_filename:
+                continue
+            exposure_image_list.append(inp_dir + '/' + image_filename)
+            mode_symbol = image_filename[18]
+            combined_filename = 'g' + obs_key + 'OM' + mode_symbol + exp_key + 'CIMAGE0000.FIT'
         
-        #parsing the list into a string...:
-        exposure_image_list = str(exposure_image_list).strip('[]')
-        exposure_image_list.replace(',', ' ')
-
         Message("... Combining sub-windows (Engineering-2 Mode data) ... ")
         highlighted_message("*", "... omcomb ...")
 
-        cmd = "imagesets=\"" + exposure_image_list + "\"" + " outset=\"" + out_directory + '/' + combined_filename + "\""
-        print('omcomb arguments: {}'.format(cmd))
+        arg_list = [f"imagesets={' '.join(exposure_image_list)}",
+            f"outset={out_dir}/{combined_filename}"]
 
-        if subprocess.Popen('omcomb {}'.format(cmd), shell = True).wait():
+        if run_sas_task('omcomb', arg_list):
             raise OSError('Failed while running omcomb.')
 
         Message('... Produced a combined image {}'.format(combined_filename))
@@ -482,208 +566,197 @@ def process_window(orb_key, obs_key, exp_key, comb_list):
     Message('... Running Tracking tasks ... ')
     i_win = 0
 
+    # Neither the plot device, the mode nor the image of a window change from
+    # one iteration to the next.
+    os.environ['PGPLOT_TYPE'] = 'ps'
+    s = mode_symbol
+    image_files = {win_key : find_file(orb_key, obs_key, exp_key, win_key, 'IMI') for win_key in comb_list}
 
     while i_win < len(comb_list):
-        if fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[i_win] + '*IMI*'):
-            print(comb_list)
+        if image_files[comb_list[i_win]]:
+            Debug('Windows: {}', comb_list)
             highlighted_message('-', 'Window {}'.format(comb_list[i_win]))
 
             if combine and combined_image_was_produced:
-                input_image_filename = out_directory + '/' + combined_filename
+                input_image_filename = out_dir + '/' + combined_filename
             else:
-                input_image_filename = inp_dir + '/' + fnmatch.filter(list_of_files, orb_key + '*' + obs_key + '*' + exp_key + '*' + comb_list[i_win] + '*IMI*')[0]
-
-            Message('Image file name: {}'.format(input_image_filename))
+                input_image_filename = inp_dir + '/' + image_files[comb_list[i_win]]
 
-            filter_id = pyutils.get_key_word(input_image_filename, 'FILTER')
+            Debug('Image file name: {}', input_image_filename)
 
-            if filter_id == 200 or filter_id == 1000:
-                if filter_id == 200:
-                    grism_id = 'Grism 2 (visual)'
-                    Message('Filter value corresponds to {}'.format(grism_id))
-                elif filter_id == 1000:
-                    grism_id = 'Grism 1 (UV)'
-                    Message('Filter value corresponds to {}'.format(grism_id))
-                else:
-                    Message('Filter value does not correspond to a grism.')
-
-
-                raw_image = 'g' + input_image_filename
-                s = mode_symbol
-
-                out_flat_filename = "g" + obs_key + "OM" + s + exp_key + "FLAFLD" + comb_list[i_win][1] + "000.FIT"
-                osw_list_intermediary_detect_filename = "p" + obs_key + "OM" + s + exp_key + "SWSRLI" + comb_list[i_win][1] + "000.FIT"
-                second_osw_list_intermediary_detect_filename = "p" + obs_key + "OM" + s + exp_key + "SWSRLI" + comb_list[i_win][1] + "001.FIT"
-                image_pps_product_filename = "p" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
-                intermediate_image_filename = "g" + obs_key + "OM" + s + exp_key + "IMAGEI" + comb_list[i_win][1] + "000.FIT"
-                detectorCoordImageFileName = "g" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
-                skyCoordImageFileName = "g" + obs_key + "OM" + s + exp_key + "SIMAGE" + comb_list[i_win][1] + "000.FIT"
-                rotatedImageFileName = "p" + obs_key + "OM" + s + exp_key + "RIMAGE" + comb_list[i_win][1] + "000.FIT"
-                smoothRotatedImageFileName = "s" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
-                undistImageFileName = "u" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
-
-                unscatteredImageFileName = "g" + obs_key + "OM" + s + exp_key + "RIMNSC" + comb_list[i_win][1] + "000.FIT"
-                bkgImageFileName = "g" + obs_key + "OM" + s + exp_key + "RIMBKG" + comb_list[i_win][1] + "000.FIT"
-
-                modulo_8_product_filename = "g" + obs_key + "OM" + s + exp_key + "MOD8MP" + comb_list[i_win][1] + "000.FIT"
-                sky_coord_pps_product_filename = "p" + obs_key + "OM" + s + exp_key + "SIMAGE" + comb_list[i_win][1] + "000.FIT"
-                region_file = "p" + obs_key + "OM" + s + exp_key + "REGION" + comb_list[i_win][1] + "000.ASC"
-                second_region_file = "p" + obs_key + "OM" + s + exp_key + "REGION" + comb_list[i_win][1] + "001.ASC"
-                spectraRegionFileName = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.ASC"
-                PPS_eventlist_file = "g" + obs_key + "OM" + s + exp_key + "EVLIST" + comb_list[i_win][1] + "000.FIT"
-
-                spectraRegionPlotName = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.PS"
-                spectraRegionPDF = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.PDF"
-                # temporary files for testing purposes
-                background_output = "tmp_background" + obs_key + "OM" + s + exp_key + "BACKGR" + comb_list[i_win][1] + ".FIT"
-                signifimage_output = "tmp_signifimage" + obs_key + "OM" + s + exp_key + "SIGNIF" + comb_list[i_win][1] + ".FIT"
-                grismOutFileName="p" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.FIT"
-
-                if extract_field_spectra:
-                    Message("Available spectra of the field objects will be extracted (by request)")
-                    out_spectra_list_filename = "p" + obs_key + "OM" + s + exp_key + "SPECLI" + comb_list[i_win][1] + "000.FIT"
-                else:
-                    Message('Extraction of the target object spectrum (no field spectra will be extracted)')
-                    out_spectra_list_filename = "p" + obs_key + "OM" + s + exp_key + "SPECLI" + comb_list[i_win][1] + "000.FIT"
-
-                Message('Running grism mode tasks...')
+            if filter_id == 200:
+                grism_id = 'Grism 2 (visual)'
+            else:
+                grism_id = 'Grism 1 (UV)'
+            Message('Filter value corresponds to {}'.format(grism_id))
+
+            raw_image = 'g' + input_image_filename
+
+            out_flat_filename = "g" + obs_key + "OM" + s + exp_key + "FLAFLD" + comb_list[i_win][1] + "000.FIT"
+            osw_list_intermediary_detect_filename = "p" + obs_key + "OM" + s + exp_key + "SWSRLI" + comb_list[i_win][1] + "000.FIT"
+            second_osw_list_intermediary_detect_filename = "p" + obs_key + "OM" + s + exp_key + "SWSRLI" + comb_list[i_win][1] + "001.FIT"
+            image_pps_product_filename = "p" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
+            intermediate_image_filename = "g" + obs_key + "OM" + s + exp_key + "IMAGEI" + comb_list[i_win][1] + "000.FIT"
+            detectorCoordImageFileName = "g" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
+            skyCoordImageFileName = "g" + obs_key + "OM" + s + exp_key + "SIMAGE" + comb_list[i_win][1] + "000.FIT"
+            rotatedImageFileName = "p" + obs_key + "OM" + s + exp_key + "RIMAGE" + comb_list[i_win][1] + "000.FIT"
+            smoothRotatedImageFileName = "s" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
+            undistImageFileName = "u" + obs_key + "OM" + s + exp_key + "IMAGE_" + comb_list[i_win][1] + "000.FIT"
+
+            unscatteredImageFileName = "g" + obs_key + "OM" + s + exp_key + "RIMNSC" + comb_list[i_win][1] + "000.FIT"
+            bkgImageFileName = "g" + obs_key + "OM" + s + exp_key + "RIMBKG" + comb_list[i_win][1] + "000.FIT"
+
+            modulo_8_product_filename = "g" + obs_key + "OM" + s + exp_key + "MOD8MP" + comb_list[i_win][1] + "000.FIT"
+            sky_coord_pps_product_filename = "p" + obs_key + "OM" + s + exp_key + "SIMAGE" + comb_list[i_win][1] + "000.FIT"
+            region_file = "p" + obs_key + "OM" + s + exp_key + "REGION" + comb_list[i_win][1] + "000.ASC"
+            second_region_file = "p" + obs_key + "OM" + s + exp_key + "REGION" + comb_list[i_win][1] + "001.ASC"
+            spectraRegionFileName = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.ASC"
+            PPS_eventlist_file = "g" + obs_key + "OM" + s + exp_key + "EVLIST" + comb_list[i_win][1] + "000.FIT"
+
+            spectraRegionPlotName = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.PS"
+            spectraRegionPDF = "p" + obs_key + "OM" + s + exp_key + "SPCREG" + comb_list[i_win][1] + "001.PDF"
+            # temporary files for testing purposes
+            background_output = "tmp_background" + obs_key + "OM" + s + exp_key + "BACKGR" + comb_list[i_win][1] + ".FIT"
+            signifimage_output = "tmp_signifimage" + obs_key + "OM" + s + exp_key + "SIGNIF" + comb_list[i_win][1] + ".FIT"
+            grismOutFileName="p" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.FIT"
+
+            if extract_field_spectra:
+                Message("Available spectra of the field objects will be extracted (by request)")
+                out_spectra_list_filename = "p" + obs_key + "OM" + s + exp_key + "SPECLI" + comb_list[i_win][1] + "000.FIT"
+            else:
+                Message('Extraction of the target object spectrum (no field spectra will be extracted)')
+                out_spectra_list_filename = "p" + obs_key + "OM" + s + exp_key + "SPECLI" + comb_list[i_win][1] + "000.FIT"
 
-                highlighted_message('*', 'omgprep')
+            Message('Running grism mode tasks...')
 
-                arg_list = "set={}".format(input_image_filename) + " nphset={}/{}".format(inp_dir, non_periodic_hk_filename) +\
-                    " pehset={}/{}".format(inp_dir, periodic_hk_filename) +\
-                    " wdxset={}/{}".format(inp_dir, window_data_filename) +\
-                    " modeset=4" + " outset={}/{}".format(out_dir, intermediate_image_filename)
+            highlighted_message('*', 'omgprep')
 
-                Message("omprep {}".format(arg_list))
+            arg_list = [f"set={input_image_filename}", f"nphset={inp_dir}/{non_periodic_hk_filename}",
+                f"pehset={inp_dir}/{periodic_hk_filename}",
+                f"wdxset={inp_dir}/{window_data_filename}",
+                "modeset=4", f"outset={out_dir}/{intermediate_image_filename}"]
 
-                if os.system('omprep {}'.format(arg_list)):
-                    highlighted_message('*', 'omprep has detected an error- this observation will not be processed')
-                    return 'Error in omprep'
+            if run_sas_task('omprep', arg_list):
+                highlighted_message('*', 'omprep has detected an error- this observation will not be processed')
+                return 'Error in omprep'
 
-                highlighted_message('*', ' ... ommodmap ...')
-                arg_list = "set={}/{}".format(out_dir, intermediate_image_filename) +\
-                    " flatset={}".format(flat_field_filename) + " mod8product=yes" +\
-                    " mod8set={}/{}".format(out_dir, modulo_8_product_filename) +\
-                    " outset={}/{}".format(out_dir, detectorCoordImageFileName) +\
-                    " outflatset={}/{}".format(out_dir, out_flat_filename) +\
-                    " nsig={}".format(ommodmap_nsig) + " nbox={}".format(ommodmap_nbox) +\
-                    " mod8correction={}".format(mod8correction)
+            highlighted_message('*', ' ... ommodmap ...')
+            arg_list = [f"set={out_dir}/{intermediate_image_filename}",
+                f"flatset={flat_field_filename}", "mod8product=yes",
+                f"mod8set={out_dir}/{modulo_8_product_filename}",
+                f"outset={out_dir}/{detectorCoordImageFileName}",
+                f"outflatset={out_dir}/{out_flat_filename}",
+                f"nsig={ommodmap_nsig}", f"nbox={ommodmap_nbox}",
+                f"mod8correction={mod8correction}"]
 
-                Message('ommodmap {}'.format(arg_list))
-                if subprocess.Popen('ommodmap {}'.format(arg_list), shell = True).wait():
-                    return 'Error while running ommodmap'
+            if run_sas_task('ommodmap', arg_list):
+                return 'Error while running ommodmap'
 
 
-                highlighted_message('*', '... omgprep ...')
-                omgprep_usecat = 'F'
+            highlighted_message('*', '... omgprep ...')
+            omgprep_usecat = 'F'
 
-                print("removeScatteredLight= {}\n".format(removeScatteredLight))
-                if removeScatteredLight:
-                    arg_list = "set={}/{}".format(out_dir, detectorCoordImageFileName) +\
-                        " outset={}/{}".format(out_dir, rotatedImageFileName) +\
-                        " undistset={}/{}".format(out_dir, undistImageFileName) +\
-                        " removescatteredlight={}".format(removeScatteredLight) +\
-                        " backgroundset={}/{}".format(out_dir, bkgImageFileName)
+            Debug('removeScatteredLight= {}', removeScatteredLight)
+            if removeScatteredLight:
+                arg_list = [f"set={out_dir}/{detectorCoordImageFileName}",
+                    f"outset={out_dir}/{rotatedImageFileName}",
+                    f"undistset={out_dir}/{undistImageFileName}",
+                    f"removescatteredlight={removeScatteredLight}",
+                    f"backgroundset={out_dir}/{bkgImageFileName}"]
+            else:
+                arg_list = [f"set={out_dir}/{detectorCoordImageFileName}",
+                    f"outset={out_dir}/{rotatedImageFileName}",
+                    f"undistset={out_dir}/{undistImageFileName}"]
+
+            if run_sas_task('omgprep', arg_list):
+                highlighted_message('*', 'omgprep has found an error.')
+                return 'Error'
+
+            level_image_file = 'LEVEL.FIT'
+
+            highlighted_message('*', '... omdetect ...')
+            arg_list = [f"nsigma={nsigma}",
+                f"set={out_dir}/{rotatedImageFileName}",
+                f"regionfile={out_dir}/{second_region_file}",
+                f"outset={out_dir}/{second_osw_list_intermediary_detect_filename}"]
+
+            if run_sas_task('omdetect', arg_list):
+                return 'Error while running omdetect.'
+
+            with open(out_dir + '/' + second_region_file, 'rb') as region_file:
+                region_content = region_file.read()
+            # one source per line; the last line may have no newline
+            n_source = region_content.count(b'\n')
+            if region_content and not region_content.endswith(b'\n'):
+                n_source = n_source + 1
+
+            Message('Number of detected sources: {}'.format(n_source))
+
+            highlighted_message('*', '... omatt ...')
+
+            arg_list = [f"set={out_dir}/{rotatedImageFileName}",
+                f"sourcelistset={out_dir}/{second_osw_list_intermediary_detect_filename}",
+                f"ppsoswset={out_dir}/{skyCoordImageFileName}", "usecat=F"]
+
+            if run_sas_task('omatt', arg_list):
+                return 'Error while running omatt'
+
+            highlighted_message('*', '... omgrism ...')
+
+            arg_list = [f"set={out_dir}/{rotatedImageFileName}",
+                f"sourcelistset={out_dir}/{second_osw_list_intermediary_detect_filename}",
+                f"outset={out_dir}/{grismOutFileName}",
+                f"bkgoffsetleft={bkgOffsetLeft}",
+                f"bkgwidthleft={bkgWidthLeft}", f"bkgoffsetright={bkgOffsetRight}",
+                f"bkgwidthright={bkgWidthRight}", f"spectrumhalfwidth={spectrumHalfWidth}",
+                f"spectrumsmoothlength={spectrumsmoothlength}",
+                f"extractionmode={extractionmode}", f"extractfieldspectra={extract_field_spectra}",
+                f"regionfile={out_dir}/{second_region_file}", f"spectraregionfile={out_dir}/{spectraRegionFileName}",
+                f"outspectralistset={out_spectra_list_filename}", f"addedregionfile={addedRegionFile}"]
+
+            if run_sas_task('omgrism', arg_list):
+                return 'Error while running omgrism.'
+
+            spectrum_plot_file0 = "g" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.PS"
+            spectrum_PDF_file0 = "p" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.PDF"
+
+            highlighted_message('*', '... omgrismplot ...')
+            Debug('OMGRISM spectrum pps file: {}', grismOutFileName)
+
+            if os.path.exists(out_dir + '/' + grismOutFileName):
+                plotBinSize = 1
+
+                arg_list = [f"set={out_dir}/{grismOutFileName}",
+                    f"scalebkgplot={scaleBkgPlot}", f"binsize={plotBinSize}",
+                    f"plotflux={plotFlux}",
+                    f"plotfile={out_dir}/{spectrum_plot_file0}",
+                    f"spectraregionfile={out_dir}/{spectraRegionFileName}",
+                    f"regionplotfile={out_dir}/{spectraRegionPlotName}",
+                    f"rotatedimageset={out_dir}/{rotatedImageFileName}"]
+
+                if run_sas_task('omgrismplot', arg_list):
+                    return 'Error in omgrismplot'
+
+                Debug('spectraRegionFileName={}/{}', out_dir, spectraRegionFileName)
+
+                # Both conversions are independent, so they run at the same time.
+                conversions = []
+                if os.path.isfile(out_dir + '/' + spectrum_plot_file0):
+                    Message('Converting the spectrum PostScript file to PDF')
+                    conversions.append(convert_ps_to_pdf(out_dir + '/' + spectrum_plot_file0, out_dir + '/' + spectrum_PDF_file0))
                 else:
-                    arg_list = "set={}/{}".format(out_dir, detectorCoordImageFileName) +\
-                        " outset={}/{}".format(out_dir, rotatedImageFileName) +\
-                        " undistset={}/{}".format(out_dir, undistImageFileName)
-
-                Message('omgprep {}'.format(arg_list))
-                if subprocess.Popen('omgprep {}'.format(arg_list), shell = True).wait():
-                    highlighted_message('*', 'omgprep has found an error.')
-                    return 'Error'
-
-                level_image_file = 'LEVEL.FIT'
-
-                highlighted_message('*', '... omdetect ...')
-                arg_list = "nsigma={}".format(nsigma) +\
-                    " set={}/{}".format(out_dir, rotatedImageFileName) +\
-                    " regionfile={}/{}".format(out_dir, second_region_file) +\
-                    " outset={}/{}".format(out_dir, second_osw_list_intermediary_detect_filename)
-
-                Message('omdetect {}'.format(arg_list))
-                if subprocess.Popen('omdetect {}'.format(arg_list), shell = True).wait():
-                    return 'Error while running omdetect.'
-
-                n_source = 0
-
-                with open(out_dir + '/' + second_region_file) as region_file:
-                    for line in region_file:
-                        n_source = n_source + 1
-
-                Message('Number of detected sources: {}'.format(n_source))
-
-                highlighted_message('*', '... omatt ...')
-
-                arg_list = "set=" +  out_dir + '/' + rotatedImageFileName +\
-                    " sourcelistset=" +  out_dir + '/' + second_osw_list_intermediary_detect_filename +\
-                    " ppsoswset=" + out_dir + '/' + skyCoordImageFileName + " usecat=F"
+                    Message("The required spectrum PostScript file is missing")
 
-                Message('omatt {}'.format(arg_list))
-                if subprocess.Popen('omatt {}'.format(arg_list), shell = True).wait():
-                    return 'Error while running omatt'
-
-                highlighted_message('*', '... omgrism ...')
-
-                arg_list = "set={}/{}".format(out_dir, rotatedImageFileName) +\
-                    " sourcelistset={}/{}".format(out_dir, second_osw_list_intermediary_detect_filename) +\
-                    " outset={}/{}".format(out_dir, grismOutFileName) +\
-                    " bkgoffsetleft={}".format(bkgOffsetLeft) +\
-                    " bkgwidthleft={}".format(bkgWidthLeft) + " bkgoffsetright={}".format(bkgOffsetRight) +\
-                    " bkgwidthright={}".format(bkgWidthRight) + " spectrumhalfwidth={}".format(spectrumHalfWidth) +\
-                    " spectrumsmoothlength={}".format(spectrumsmoothlength) +\
-                    " extractionmode={}".format(extractionmode) + " extractfieldspectra={}".format(extract_field_spectra) +\
-                    " regionfile={}/{}".format(out_dir, second_region_file) + " spectraregionfile={}/{}".format(out_dir, spectraRegionFileName) +\
-                    " outspectralistset={}".format(out_spectra_list_filename) + " addedregionfile={}".format(addedRegionFile)
-
-                Message('omgrism {}'.format(arg_list))
-
-                if subprocess.Popen('omgrism {}'.format(arg_list), shell = True).wait():
-                    return 'Error while running omgrism.'
-
-                spectrum_plot_file0 = "g" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.PS"
-                spectrum_PDF_file0 = "p" + obs_key + "OM" + s + exp_key + "SPECTR" + comb_list[i_win][1] + "000.PDF"
-
-                highlighted_message('*', '... omgrismplot ...')
-                Message('OMGRISM spectrum pps file: {}'.format(grismOutFileName))
-
-                if os.path.exists(out_dir + '/' + grismOutFileName):
-                    plotBinSize = 1
-                    os.environ['PGPLOT_TYPE'] = 'ps'
-
-                    arg_list = "set=" + out_dir + '/' + grismOutFileName +\
-                        " scalebkgplot={}".format(scaleBkgPlot) + " binsize={}".format(plotBinSize) +\
-                        " plotflux={}".format(plotFlux) +\
-                        " plotfile=t.ps" + " spectraregionfile=" + out_dir + '/' + spectraRegionFileName +\
-                        " regionplotfile=r.ps" + " rotatedimageset=" + out_dir + '/' + rotatedImageFileName
-
-                    Message('omgrismplot {}'.format(arg_list))
-
-                    if subprocess.Popen('omgrismplot {}'.format(arg_list), shell = True).wait():
-                        return 'Error in omgrismplot'
-
-                    os.rename('t.ps', out_dir + '/' + spectrum_plot_file0)
-                    os.rename('r.ps', out_dir + '/' + spectraRegionPlotName)
-
-                    print("spectraRegionFileName={}/{} \n".format(out_dir, spectraRegionFileName))
-                    if os.path.isfile(out_dir + '/' + spectrum_plot_file0):
-                        Message('Converting the spectrum PostScript file to PDF')
-                        if subprocess.Popen('ps2pdf {}/{} {}/{}'.format(out_dir, spectrum_plot_file0, out_dir, spectraRegionPDF), shell = True).wait():
-                            return 'Error while converting to pdf.'
-
-                    else:
-                        Message("The required spectrum PostScript file is missing")
-
-                    if os.path.exists(out_dir + '/' + spectraRegionPlotName):
-                        Message("Converting the spectrum region PostScript file to PDF")
-                        if subprocess.Popen('ps2pdf {}/{} {}/{}'.format(out_dir, spectraRegionPlotName, out_dir, spectraRegionPDF), shell = True).wait():
-                            return 'Error while converting to pdf.'
-                    else:
-                        Message("The spectrum region PostScript file is missing")
+                if os.path.exists(out_dir + '/' + spectraRegionPlotName):
+                    Message("Converting the spectrum region PostScript file to PDF")
+                    conversions.append(convert_ps_to_pdf(out_dir + '/' + spectraRegionPlotName, out_dir + '/' + spectraRegionPDF))
                 else:
-                    Message("File {} does not exist: no plot produced".format(grismOutFileName))
+                    Message("The spectrum region PostScript file is missing")
+
+                if any([conversion.wait() for conversion in conversions]):
+                    return 'Error while converting to pdf.'
+            else:
+                Message("File {} does not exist: no plot produced".format(grismOutFileName))
         else:
             Message('Image file for this window does not exist.')
 
@@ -746,15 +819,17 @@ def omgchain():
 
     global list_of_files
 
-    list_of_files = glob.glob(inp_dir + '/*FIT')
-    for i in range(0, len(list_of_files)):
-        list_of_files[i] = list_of_files[i].replace(inp_dir + '/', '')
+    list_of_files = find_FIT_files(inp_dir)
 
     global periodic_hk_filename
     global non_periodic_hk_filename
 
     periodic_hk_filename, non_periodic_hk_filename = check_for_house_keeping_files(list_of_files)
 
+    global file_index
+
+    file_index = index_list_of_files(list_of_files)
+
     global orb_list
     global obs_list
     global exp_list
@@ -762,11 +837,71 @@ def omgchain():
 
     orb_list, obs_list, exp_list, win_list = fill_orb_obs_exp_dict(list_of_files)
 
+    # The exposures of all the orbits go to a single pool, so that the orbits
+    # overlap as well without nesting thread pools.
+    exposures = []
     for orb_key in orb_list.keys():
-        process_orbit(orb_key, has_ff, ff_name)
+        exposures.extend(orbit_exposures(orb_key, has_ff, ff_name))
+
+    process_exposures(exposures)
 # end of omgchain
 
 
+def split_odf_name(filename):
+    """
+    Splits the name of an OM ODF file into its components. The names have
+    fixed positions, e.g. 0070_0125320701_OMS00600IMI.FIT.
+
+    Args:
+        filename: the name of the file, without the path.
+
+    Output:
+        (orbit, obsid, exposure, window, kind): the components of the name as strings.
+    """
+
+    return (filename[0:4], filename[5:15], filename[19:22], filename[22:24], filename[24:27])
+
+
+def index_list_of_files(list_of_files):
+    """
+    Indexes the ODF files by the components of their names, so they can be
+    looked up directly instead of matching patterns against the whole list.
+
+    Args:
+        list_of_files: the list of FIT files to index.
+
+    Output:
+        file_index: dictionary mapping (orbit, obsid, exposure, window, kind) to the file name.
+    """
+
+    file_index = dict()
+
+    for i in list_of_files:
+        key = split_odf_name(i)
+        if key not in file_index:
+            file_index.update({key : i})
+
+    return file_index
+
+
+def find_file(orb_key, obs_key, exp_key, win_key, kind):
+    """
+    Returns the name of the ODF file matching the given name components.
+
+    Args:
+        orb_key: the orbit key.
+        obs_key: the observation key.
+        exp_key: the exposure key.
+        win_key: the window key.
+        kind: the file type, e.g. IMI, THX, WDX, NPH or PEH.
+
+    Output:
+        the file name, or None if there is no such file in the ODF.
+    """
+
+    return file_index.get((orb_key, obs_key, exp_key, win_key, kind))
+
+
 def fill_orb_obs_exp_dict(list_of_files):
     """
     Fill several dictionaries containing info of the orbit, the observation,
@@ -783,37 +918,46 @@ def fill_orb_obs_exp_dict(list_of_files):
     exp_list = dict()
     win_list = dict()
 
+    # (key, value) pairs already added, so membership is not a list scan
+    obs_seen = set()
+    exp_seen = set()
+    win_seen = set()
+
     for i in list_of_files:
 
-        if i.endswith('IMI.FIT'):
-            print(i)
-            orbit = i[0:4]
-            obs = i[5:15]
-            expo = i[19:22]
-            win = i[22:24]
-
-            orb_list.update({i[0:4] : i[0:4]})
-            if obs in obs_list:
-                if orbit not in obs_list[obs]:
-                    obs_list[obs].append(orbit)
-            else:
-                obs_list.update({obs : [orbit]})
-            if expo in exp_list:
-                if obs not in exp_list[expo]:
-                    exp_list[expo].append(obs)
-            else:
-                exp_list.update({expo : [obs]})
-            if win in win_list:
-                if expo not in win_list[win]:
-                    win_list[win].append(expo)
-            else:
-                win_list.update({win : [expo]})
+        match = imi_file_pattern.match(i)
+        if match:
+            Debug('IMI file: {}', i)
+            orbit, obs, expo, win = match.groups()
+
+            orb_list[orbit] = orbit
+
+            if (obs, orbit) not in obs_seen:
+                obs_seen.add((obs, orbit))
+                obs_list.setdefault(obs, []).append(orbit)
+
+            if (expo, obs) not in exp_seen:
+                exp_seen.add((expo, obs))
+                exp_list.setdefault(expo, []).append(obs)
+
+            if (win, expo) not in win_seen:
+                win_seen.add((win, expo))
+                win_list.setdefault(win, []).append(expo)
 
     return (orb_list, obs_list, exp_list, win_list)
 
 
 def run(iparsdic):
     
+    # The log file is set up once per session, not on every message.
+    if not logger.handlers:
+        logger.addHandler(logging.FileHandler('pyomgchain.log'))
+
+    if int(os.environ.get('SAS_VERBOSITY', '5')) >= 8:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
     print(f'Executing {__file__} {iparsdic}')
 
     start = time.time()
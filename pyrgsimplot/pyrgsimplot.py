@@ -27,25 +27,26 @@ import pysas.pyutils.pyutils as pyutils
 import os
 import numpy as np
 import sys
-import pysas.pysasplot_utils.pysasplot_utils as sasplt
 from astropy.io import fits
-import matplotlib.pyplot as plt
 from astropy import units as u
 import warnings
 warnings.filterwarnings('ignore')
-from matplotlib.colors import LogNorm
-from matplotlib.colors import PowerNorm
+# matplotlib, the WCS and the coordinates are only imported by the functions
+# that plot, so importing this module stays cheap.
 import glob
 import time
-import matplotlib.transforms as tr
-from astropy.wcs import WCS
-from astropy.coordinates import Angle
 from pysas.logger import TaskLogger as TL
 PI = u.def_unit('PI', 1 * u.eV)
 u.add_enabled_units([PI])
 
 logger = TL('pyrgsimplot')
 
+# Colour maps already resolved by get_colour_map, by (name, inverted).
+colour_maps = dict()
+
+# One line of the source details printed below the image: label, RA and DEC.
+source_text = r"$\bf{{Label: }}$ {0} $\bf{{RA: }}$ {1} $\bf{{DEC: }}$ {2}" + '\n'
+
 
 def set_xlabel(xlabel):
     """
@@ -75,10 +76,11 @@ def set_xlabel(xlabel):
 
 def getobservationdetails(in_dataset):
     """
-    Uses pyutils to return the keywords corresponding to the given fits file.
+    Uses pyutils to return the keywords corresponding to the given fits file,
+    all taken from the primary header in a single pass.
 
     Args:
-        in_dataset: the fits file to evaluate.
+        in_dataset: the opened fits file to evaluate.
 
     Output:
         fits_info: list containing the exposure, telescope, obs_id, exp_id, instr,
@@ -87,13 +89,9 @@ def getobservationdetails(in_dataset):
 
     logger.log('debug', 'Running getobservationdetails...')
 
-    exposure = pyutils.get_key_word(in_dataset, 'EXPOSURE', 0)
-    telescope = pyutils.get_key_word(in_dataset, 'TELESCOP', 0)
-    obs_id = pyutils.get_key_word(in_dataset, 'OBS_ID', 0)
-    exp_id = str(pyutils.get_key_word(in_dataset, 'EXP_ID', 0))[-3:]
-    instr = pyutils.get_key_word(in_dataset, 'INSTRUME', 0)
-    date_obs = pyutils.get_key_word(in_dataset, 'DATE-OBS', 0)
-    date_end = pyutils.get_key_word(in_dataset, 'DATE-END', 0)
+    exposure, telescope, obs_id, exp_id, instr, date_obs, date_end = pyutils.get_key_words(in_dataset,
+        ('EXPOSURE', 'TELESCOP', 'OBS_ID', 'EXP_ID', 'INSTRUME', 'DATE-OBS', 'DATE-END'), 0)
+    exp_id = str(exp_id)[-3:]
 
     fits_info = [exposure, telescope, obs_id, exp_id, instr, date_obs, date_end]
     
@@ -141,51 +139,55 @@ def plot_image(data, hdu, fits_info, xlabel, ylabel, norm, colourmap, region_lis
         ylabel: name of the ylabel.
         norm: normalization to use.
         colourmap: the colour map of the image.
-        region_list: the dictionary containing the regions to be plotted.
+        region_list: the dictionary containing the regions to be plotted, as (x, y, colour).
         plot_title: the title for the plot.
         kind: the two types of plot to use.
-        srclist: file corresponding to the source list to plot the RA and DEC.
+        srclist: the source list read by read_source_list, to plot the RA and DEC.
     """
 
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import LogNorm, PowerNorm
+    from astropy.wcs import WCS
+
     exposure, telescope, obs_id, exp_id, instr, date_obs, date_end, typing = fits_info
    
     if dark_mode:
         plt.style.use('dark_background')
 
-    if norm.upper() == 'LOG':
-        norm = LogNorm()
-        # Uncomment the following lines to change empty pixels with the minimum value.
-        #second_minimum = sorted(set(data.flatten()))[1]
-        #data[data == 0] = second_minimum
-        norm_name = 'log'
-    elif norm.upper() == 'POW':
-        norm = PowerNorm(gamma = gamma)
-        norm_name = 'power'
-    else:
-        norm = ''
-        norm_name = 'linear'
+    # The colour normalization for each value of the colourmap parameter, with
+    # its name for the colour bar. Anything else is linear.
+    # Uncomment the following lines to change empty pixels with the minimum value for 'LOG'.
+    #second_minimum = sorted(set(data.flatten()))[1]
+    #data[data == 0] = second_minimum
+    norm_factory = {'LOG' : (lambda gamma: LogNorm(), 'log'),
+                    'POW' : (lambda gamma: PowerNorm(gamma = gamma), 'power')}
+    make_norm, norm_name = norm_factory.get(norm.upper(), (lambda gamma: None, 'linear'))
+    norm = make_norm(gamma)
     
     logger.log('info', 'Plotting {0}.'.format(plot_title))
 
     wcs = WCS(hdu)
-    fig, ax1 = plt.subplots(subplot_kw = {'projection': wcs})
+    # a PNG has a fixed number of pixels, so there is no need to colour more
+    bin_factor = 1
+    if out_format.upper() == 'PNG':
+        data, wcs, bin_factor = downsample_image(data, wcs, 12 * 150)
+
+    show_plot = device and os.environ.get('DISPLAY')
+    if show_plot:
+        fig, ax1 = plt.subplots(subplot_kw = {'projection': wcs})
+    else:
+        # a figure outside pyplot drawn with Agg, so no GUI backend is loaded
+        # and the backend of the calling session is left as it is
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax1 = fig.add_subplot(projection = wcs)
 
-    try:
-        with u.add_enabled_units([PI]):
-            if inverted:
-                colour_map_parsed = plt.cm.get_cmap(colourmap)
-                im = ax1.imshow(data,interpolation = None, origin = 'lower', aspect = 'auto', norm = norm, cmap = colour_map_parsed.reversed())
-            else:
-                im = ax1.imshow(data,interpolation = None, origin = 'lower', aspect = 'auto', norm = norm, cmap = colourmap)
-    except ValueError:
-        logger.log('warning', 'The input colourmap is not available for matplotlib. Using \'plasma\' by default.')
-        colourmap = 'plasma'
-        with u.add_enabled_units([PI]):
-            if inverted:
-                colour_map_parsed = plt.cm.get_cmap(colourmap)
-                im = ax1.imshow(data,interpolation = None, origin = 'lower', aspect = 'auto', norm = norm, cmap = colour_map_parsed.reversed())
-            else:
-                im = ax1.imshow(data,interpolation = None, origin = 'lower', aspect = 'auto', norm = norm, cmap = colourmap)
+    colour_map_parsed = get_colour_map(colourmap, inverted)
+
+    with u.add_enabled_units([PI]):
+        im = ax1.imshow(data,interpolation = None, origin = 'lower', aspect = 'auto', norm = norm, cmap = colour_map_parsed)
 
     # if the plot is reduced to the PI detection even if the sources extend it:
     #ylims = ax1.get_ylim()
@@ -193,42 +195,35 @@ def plot_image(data, hdu, fits_info, xlabel, ylabel, norm, colourmap, region_lis
 
     if region_list:
         for key in region_list.keys():
-            # masking out the non-value coordinates marked as 0:
-            filt_valuex = region_list[key][0]
-            filt_valuex[filt_valuex == 0] = np.nan
-            filt_valuey = region_list[key][1]
-            filt_valuey[filt_valuey == 0] = np.nan
+            # masking out the non-value coordinates marked as 0, in new arrays
+            # so the source list tables are left untouched:
+            valuex, valuey, colour_plot = region_list[key]
+            filt_valuex = np.where(valuex == 0, np.nan, valuex)
+            filt_valuey = np.where(valuey == 0, np.nan, valuey)
             with u.add_enabled_units([PI]):
-                if kind == 'endisp':
-                    order_key = key[key.upper().find('ORDER') + 6]
-                    if not order_key.isnumeric():
-                        logger.log('warning', 'Could not identify the order in the source key.')
-                        colour_plot = 'C0'
-                    else:
-                        colour_plot = 'C{0}'.format(order_key)
-                else:
-                    colour_plot = 'C0'
                 if 'ext' in key:
                     ax1.plot(filt_valuex, filt_valuey,'--', color = colour_plot, transform = ax1.get_transform('world'))
                 else:
                     ax1.plot(filt_valuex, filt_valuey, color = colour_plot, transform = ax1.get_transform('world'))
     
+    text = ''
     if srclist:
-        text = ''
         s_ra, s_dec, s_label = get_source_details(srclist)
-        for i in range(0, len(s_label)):
-            aux_text = r"$\bf{Label: }$ " + s_label[i] + r" $\bf{RA: }$ " + s_ra[i] + r" $\bf{DEC: }$ " + s_dec[i] + '\n'
-            text = text + aux_text
+        text = ''.join([source_text.format(s_label[i], s_ra[i], s_dec[i]) for i in range(0, len(s_label))])
 
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
+    ax1.set_xlabel(xlabel)
+    ax1.set_ylabel(ylabel)
     cbar = fig.colorbar(im)
 
+    if bin_factor > 1:
+        pixel_name = '{0}x{0} binned pixels'.format(bin_factor)
+    else:
+        pixel_name = 'binned pixel'
     if norm_name != 'power':
-        cbar.ax.set_ylabel('Counts per binned pixel ({} intensity).'.format(norm_name))
+        cbar.ax.set_ylabel('Counts per {0} ({1} intensity).'.format(pixel_name, norm_name))
     else:
-        cbar.ax.set_ylabel('Counts per binned pixel (power (gamma = {}) intensity).'.format(gamma))
-    plt.figtext(0.5, 0.01, text)
+        cbar.ax.set_ylabel('Counts per {0} (power (gamma = {1}) intensity).'.format(pixel_name, gamma))
+    fig.text(0.5, 0.01, text)
     #ax1.set_xlim(xlims)
     #ax1.set_ylim(ylims)
     fig.set_size_inches(12, 9)
@@ -241,25 +236,100 @@ def plot_image(data, hdu, fits_info, xlabel, ylabel, norm, colourmap, region_lis
     
     try:
         logger.log('debug', 'Saving {} {}.'.format(plot_title, out_format))
-        plt.savefig(plot_title + '.' + out_format)
+        fig.savefig(plot_title + '.' + out_format)
     except FileNotFoundError:
         try:
             dirs, rfile = os.path.split(plot_title + '.' + out_format)
             os.makedirs(dirs)
-            plt.savefig(plot_title + '.' + out_format)
+            fig.savefig(plot_title + '.' + out_format)
         except:
             logger.log('error', 'Could not create {}. Could not resolve the given path.'.format(plot_title + '.' + out_format))
 
     
-    if device:
-        if os.getenv['DISPLAY']:
-            plt.show()
-        else:
-            logger.log('warning', 'Display not available.')
+    if show_plot:
+        plt.show()
+    elif device:
+        logger.log('warning', 'Display not available.')
 
     logger.log('info', 'Created {}.'.format(plot_title))
 
 
+def get_colour_map(colourmap, inverted):
+    """
+    Returns the matplotlib colour map for the given name, reversed if requested.
+    The colour maps are built once and kept in colour_maps.
+
+    Args:
+        colourmap: the name of the colour map. 'plasma' is used if matplotlib does not have it.
+        inverted: whether or not the colour map has to be reversed.
+
+    Output:
+        colour_map_parsed: the colour map object.
+    """
+
+    if (colourmap, inverted) not in colour_maps:
+        import matplotlib
+        try:
+            colour_map_parsed = matplotlib.colormaps[colourmap]
+        except KeyError:
+            logger.log('warning', 'The input colourmap is not available for matplotlib. Using \'plasma\' by default.')
+            colour_map_parsed = matplotlib.colormaps['plasma']
+        if inverted:
+            colour_map_parsed = colour_map_parsed.reversed()
+        colour_maps.update({(colourmap, inverted) : colour_map_parsed})
+
+    return colour_maps[(colourmap, inverted)]
+
+
+def downsample_image(data, wcs, max_size):
+    """
+    Sums blocks of pixels of an image so that its longest side is not larger
+    than max_size. The WCS is sliced with the same step so that the axes and
+    the regions stay in place. Rows and columns that do not fill a whole block
+    are dropped. The blocks are summed one axis at a time, so a memory mapped
+    image is read once without a full size copy.
+
+    Args:
+        data: the image array.
+        wcs: the WCS of the image.
+        max_size: the maximum number of pixels wanted on each side.
+
+    Output:
+        (data, wcs, factor): the binned image, its WCS and the binning factor used.
+    """
+
+    factor = -(-max(data.shape) // max_size)
+    if factor <= 1:
+        return np.ascontiguousarray(data, dtype = np.float32), wcs, 1
+
+    logger.log('debug', 'Binning the image {0}x{0} before plotting.'.format(factor))
+    ny, nx = data.shape[0] // factor, data.shape[1] // factor
+    binned = data[:ny * factor, :nx * factor].reshape(ny, factor, nx * factor).sum(axis = 1, dtype = np.float32)
+    binned = binned.reshape(ny, nx, factor).sum(axis = 2)
+
+    return binned, wcs[::factor, ::factor], factor
+
+
+def read_image(in_dataset):
+    """
+    Returns the image of the primary HDU of a file opened with memmap. A PNG
+    is binned down by downsample_image, which reads the mapped image directly,
+    so the image stays mapped. Otherwise it is read at once into a contiguous
+    float32 array. Either stays valid once the file is closed.
+
+    Args:
+        in_dataset: the HDU list of the image file.
+
+    Output:
+        in_array: the image.
+    """
+
+    if out_format.upper() == 'PNG':
+        return in_dataset[0].data
+
+    return np.ascontiguousarray(in_dataset[0].data, dtype = np.float32)
+
+
 def getarrayattributes(data_header):
     """
     From the header of an array, gets the basic information needed.
@@ -290,6 +360,22 @@ def getarrayattributes(data_header):
     return (xlabel, ylabel, xref, yref, xbinwidth, ybinwidth, xmin, ymin)
 
 
+def str_to_bool(string_param):
+    """
+    Returns True or False depending on the strings found in parameters that are supposed
+    to be booleans.
+
+    Args:
+        string_param: the given parameter.
+
+    Output:
+        bool
+    """
+
+    string_param = string_param.upper()
+    return 'Y' in string_param or 'T' in string_param
+
+
 def run(iparsdic):
     print(f'Executing {__file__} {iparsdic}')
 
@@ -297,48 +383,22 @@ def run(iparsdic):
 
     global withspatialset, withendispset
 
-    withspatialset = iparsdic['withspatialset']
-    if 'Y' in withspatialset.upper() or 'T' in withspatialset.upper():
-        withspatialset = True
-    else:
-        withspatialset = False
-
-    withendispset = iparsdic['withendispset']
-    if 'Y' in withendispset.upper() or 'T' in withendispset.upper():
-        withendispset = True
-    else:
-        withendispset = False
-    
-    withspatialregionsets = iparsdic['withspatialregionsets']
-    if 'Y' in withspatialregionsets.upper() or 'T' in withspatialregionsets.upper():
-        withspatialregionsets = True
-    else:
-        withspatialregionsets = False
+    withspatialset = str_to_bool(iparsdic['withspatialset'])
+    withendispset = str_to_bool(iparsdic['withendispset'])
+    withspatialregionsets = str_to_bool(iparsdic['withspatialregionsets'])
 
     order_list = iparsdic['orderlist']
     order_list = order_list.replace(' ','').split(',')
 
     global inverted
-    inverted = iparsdic['inverted']
-    if 'Y' in inverted.upper() or 'T' in inverted.upper():
-        inverted = True
-    else:
-        inverted = False
+    inverted = str_to_bool(iparsdic['inverted'])
 
     global out_format
 
-    withendispregionsets = iparsdic['withendispregionsets']
-    if 'Y' in withendispregionsets.upper() or 'T' in withendispregionsets.upper():
-        withendispregionsets = True
-    else:
-        withendispregionsets = False
+    withendispregionsets = str_to_bool(iparsdic['withendispregionsets'])
 
     global device
-    device = iparsdic['device']
-    if 'Y' in device.upper() or 'T' in device.upper():
-        device = True
-    else:
-        device = False
+    device = str_to_bool(iparsdic['device'])
 
     endispset = iparsdic['endispset']
     spatialset = iparsdic['spatialset']
@@ -346,6 +406,10 @@ def run(iparsdic):
     srclistset = iparsdic['srclistset']
     if not os.path.isfile(srclistset):
         srclistset = None
+        srclist = None
+    else:
+        # The source list is read once, for both blocks.
+        srclist = read_source_list(srclistset)
 
     plot_title = iparsdic['plotfile']
     plot_title = os.path.abspath(plot_title)
@@ -368,11 +432,7 @@ def run(iparsdic):
     gamma = float(iparsdic['gamma'])
     
     global dark_mode
-    dark_mode = iparsdic['dark_mode']
-    if 'Y' in dark_mode.upper() or 'T' in dark_mode.upper():
-        dark_mode = True
-    else:
-        dark_mode = False
+    dark_mode = str_to_bool(iparsdic['dark_mode'])
 
     if not withspatialset and not withendispset:
         logger.log('error', 'Nothing to plot.')
@@ -393,10 +453,10 @@ def run(iparsdic):
 
     if withspatialset:
         try:
-            with fits.open(spatialset) as in_dataset:
+            with fits.open(spatialset, memmap = True, lazy_load_hdus = True) as in_dataset:
                 fits_info = getobservationdetails(in_dataset)
                 fits_info.append('Spatial')
-                in_array = in_dataset[0].data
+                in_array = read_image(in_dataset)
                 array_header = in_dataset[0].header
         except FileNotFoundError:
             logger.log('error', 'Could not open spatial set file.')
@@ -411,11 +471,11 @@ def run(iparsdic):
         limits = [xmin, ymin, xmax, ymax]
 
         if withspatialregionsets:
-            region_list = collect_regions_spatial(srclistset, n_sources)
+            region_list = collect_regions_spatial(srclist, n_sources)
         else:
             region_list = None
         
-        plot_image(in_array, array_header, fits_info, xlabel, ylabel, norm, colourmap, region_list, plot_title, 'spatial', srclistset)
+        plot_image(in_array, array_header, fits_info, xlabel, ylabel, norm, colourmap, region_list, plot_title, 'spatial', srclist)
 
 
     ###############################
@@ -426,8 +486,8 @@ def run(iparsdic):
 
     if withendispset:
         try:
-            with fits.open(endispset) as in_dataset:
-                in_array = in_dataset[0].data
+            with fits.open(endispset, memmap = True, lazy_load_hdus = True) as in_dataset:
+                in_array = read_image(in_dataset)
                 fits_info = getobservationdetails(in_dataset)
                 fits_info.append('Energy dispersion')
                 array_header = in_dataset[0].header
@@ -444,13 +504,14 @@ def run(iparsdic):
         limits = [xmin, xmax, ymin, ymax]
 
         if withendispregionsets:
-            region_list = collect_region_order(srclistset, n_sources, order_list)
+            region_list = collect_region_order(srclist, n_sources, order_list)
         else:
             region_list = None
-        plot_image(in_array, array_header, fits_info, xlabel, ylabel, norm, colourmap, region_list, plot_title, 'endisp', srclistset)
+        plot_image(in_array, array_header, fits_info, xlabel, ylabel, norm, colourmap, region_list, plot_title, 'endisp', srclist)
 
 
     if out_format.upper() == 'PDF' and withendispset and withspatialset:
+        import pysas.pysasplot_utils.pysasplot_utils as sasplt
         pdf_files = glob.glob(plot_title + '*.{}'.format(out_format))
         logger.log('debug', 'Merging PDFs... ({}).'.format(pdf_files))
         status = sasplt.merge_pdf(pdf_files, plot_title + '.{}'.format(out_format))
@@ -464,34 +525,58 @@ def run(iparsdic):
     logger.log('info', 'All blocks completed in time {}.'.format(round(t_stop - t_start, 2)))
 
 
-def get_source_details(srclistset):
+def read_source_list(srclistset):
     """
-    Gets information regarding the SRCLIST extension from the given source list.
+    Reads the source list file once: the SRCLIST table and the tables of
+    the spatial and order regions.
 
     Args:
         srclistset: the path to the source list fits file.
 
     Output:
-        tuple containing the list of RA, DEC and labels of the sources.
+        srclist: dictionary with the SRCLIST table ('sources') and a dictionary
+    with the region tables by extension name, in file order ('regions').
     """
-    
-    logger.log('debug', 'Evaluating the coordinates of the source list...')
+
+    logger.log('debug', 'Reading the source list...')
 
     try:
         with fits.open(srclistset) as f:
-            source_table = f[1].data
+            sources = f[1].data
+            regions = dict()
+            for h in f:
+                if 'SPATIAL' in h.name or 'ORDER' in h.name:
+                    regions.update({h.name : h.data})
     except FileNotFoundError:
-        logger.log('error', 'Could not open the soure list set.')
+        logger.log('error', 'Could not open the source list file.')
         sys.exit(0)
 
-    source_ra = []
-    source_dec = []
-    source_name = []
+    return {'sources' : sources, 'regions' : regions}
 
-    for row in source_table:
-        source_name.append(row['LABEL'])
-        source_ra.append(transform_to_hms(row['RA']))
-        source_dec.append(transform_to_dms(row['DEC']))
+
+def get_source_details(srclist):
+    """
+    Gets information regarding the SRCLIST extension from the given source list.
+
+    Args:
+        srclist: the source list read by read_source_list.
+
+    Output:
+        tuple containing the list of RA, DEC and labels of the sources.
+    """
+
+    from astropy.coordinates import Angle
+    
+    logger.log('debug', 'Evaluating the coordinates of the source list...')
+
+    source_table = srclist['sources']
+    # All the coordinates are converted at once.
+    ra_h, ra_m, ra_s = Angle(source_table['RA'], u.deg).hms
+    dec_d, dec_m, dec_s = Angle(source_table['DEC'], u.deg).dms
+
+    source_name = list(source_table['LABEL'])
+    source_ra = ['{0}H:{1}M:{2}S'.format(int(ra_h[i]), int(ra_m[i]), round(int(ra_s[i]),2)) for i in range(0, len(source_name))]
+    source_dec = ['{0}D:{1}M:{2}S'.format(int(dec_d[i]), int(dec_m[i]), round(int(dec_s[i]),2)) for i in range(0, len(source_name))]
 
     return (source_ra, source_dec, source_name)
 
@@ -508,6 +593,8 @@ def transform_to_hms(value):
         transformed: the tuple with the new data.
     """
 
+    from astropy.coordinates import Angle
+
     logger.log('debug', 'Transforming unit...')
     
     value = str(value)
@@ -529,6 +616,8 @@ def transform_to_dms(value):
         transformed: the tuple with the new data.
     """
 
+    from astropy.coordinates import Angle
+
     logger.log('debug', 'Transforming unit...')
 
     value = str(value)
@@ -544,11 +633,11 @@ def collect_regions_spatial(srclist, n_sources):
     passed.
 
     Args:
-        srclist: the source list fits file.
+        srclist: the source list read by read_source_list.
         n_sources: the source number that has to be checked.
 
     Output:
-        region_list: a dictionary containing the regions ready to plot.
+        region_list: a dictionary containing the regions ready to plot, as (x, y, colour).
     """
     
     logger.log('debug', 'Collecting the spatial regions...')
@@ -556,34 +645,35 @@ def collect_regions_spatial(srclist, n_sources):
     if n_sources == 0:
         return None
 
+    if srclist is None:
+        logger.log('warning', 'No source list available to collect the spatial regions.')
+        return None
+
     region_list = dict()
     ext = ''
     sp_regions = []
     
-    try:
-        with fits.open(srclist) as f:
-            for h in f:
-                if 'SPATIAL' in h.name:
-                    sp_regions.append(h.name)
-            if len(sp_regions) == 1:
-                ext = sp_regions[0]
-            elif len(sp_regions) >= 1:
-                for i in sp_regions:
-                    if '_SRC{}'.format(n_sources) in i:
-                        ext = i
-            if ext == '':
-                logger.log('warning', 'Could not locate spatial regions in the source list.')
-                return None
+    for name in srclist['regions']:
+        if 'SPATIAL' in name:
+            sp_regions.append(name)
+    if len(sp_regions) == 1:
+        ext = sp_regions[0]
+    elif len(sp_regions) >= 1:
+        for i in sp_regions:
+            if '_SRC{}'.format(n_sources) in i:
+                ext = i
+    if ext == '':
+        logger.log('warning', 'Could not locate spatial regions in the source list.')
+        return None
+    else:
+        region_data = srclist['regions'][ext]
+        dimen, xtag, ytag, component = region_data.names
+        shapes, xvalues, yvalues = region_data[dimen], region_data[xtag], region_data[ytag]
+        for i in range(0, len(region_data)):
+            if '!' in shapes[i]:
+                region_list.update({'ext{}'.format(i) : (xvalues[i], yvalues[i], 'C0')})
             else:
-                dimen, xtag, ytag, component = f[ext].data.names
-                for i in range(0, len(f[ext].data)):
-                    if '!' in f[ext].data[dimen][i]:
-                        region_list.update({'ext{}'.format(i) : (f[ext].data[i][xtag], f[ext].data[i][ytag])})
-                    else:
-                        region_list.update({'inc{}'.format(i) : (f[ext].data[i][xtag], f[ext].data[i][ytag])})
-    except FileNotFoundError:
-        logger.log('error', 'Could not open the source list file.')
-        sys.exit(0)
+                region_list.update({'inc{}'.format(i) : (xvalues[i], yvalues[i], 'C0')})
 
     logger.log('debug', 'Spatial regions collected.')
 
@@ -596,12 +686,12 @@ def collect_region_order(srclist, n_sources, order_list):
     specified order/orders and the specified source.
 
     Args:
-        srclist: the path to the file for the source list.
+        srclist: the source list read by read_source_list.
         n_sources: the source id to find in the source list.
         order_list: the energy orders to be evaluated.
 
     Output:
-        region_list: the dictionary containing the regions.
+        region_list: the dictionary containing the regions, as (x, y, colour).
     """
 
     logger.log('debug', 'Selecting regions for energy dispersion plot...')
@@ -609,37 +699,44 @@ def collect_region_order(srclist, n_sources, order_list):
     if n_sources == 0:
         return None
 
+    if srclist is None:
+        logger.log('warning', 'No source list available to collect the order regions.')
+        return None
+
     region_list = dict()
-    ext = []
-    en_regions = []
 
-    try:
-        with fits.open(srclist) as f:
-            for h in f:
-                if 'ORDER' in h.name:
-                    en_regions.append(h.name)
-            if len(en_regions) == 1:
-                ext = en_regions[0]
-            elif len(en_regions) >= 1:
-                for i in en_regions:
-                    if '_SRC{}'.format(n_sources) in i:
-                        for order in order_list:
-                            if '_{}'.format(order) in i:
-                                ext.append(i)
-            if len(ext) == 0:
-                logger.log('warning', 'WARNING: no regions were matched for the srcidlist.')
-                return None
+    en_regions = [name for name in srclist['regions'] if 'ORDER' in name]
+    if len(en_regions) == 1:
+        ext = en_regions
+    else:
+        # Extensions for the source and any of the orders, each taken once.
+        source_tag = '_SRC{}'.format(n_sources)
+        order_tags = ['_{}'.format(order) for order in order_list]
+        ext = [name for name in en_regions
+               if source_tag in name and any(tag in name for tag in order_tags)]
+    if len(ext) == 0:
+        logger.log('warning', 'WARNING: no regions were matched for the srcidlist.')
+        return None
+    else:
+        for e in ext:
+            region_data = srclist['regions'][e]
+            dimen, xtag, ytag, component = region_data.names
+            shapes, xvalues, yvalues = region_data[dimen], region_data[xtag], region_data[ytag]
+
+            # The colour follows the order, taken from the extension name.
+            order_pos = e.upper().find('ORDER') + 6
+            order_key = e[order_pos:order_pos + 1]
+            if not order_key.isnumeric():
+                logger.log('warning', 'Could not identify the order in the source key.')
+                colour_plot = 'C0'
             else:
-                for e in ext:
-                    dimen, xtag, ytag, component = f[e].data.names
-                    for i in range(0, len(f[e].data)):
-                        if '!' in f[e].data[dimen][i]:
-                            region_list.update({'ext{}'.format(e + ':' + str(i)) : (f[e].data[i][xtag], f[e].data[i][ytag])})
-                        else:
-                            region_list.update({'inc{}'.format(e + ':' + str(i)) : (f[e].data[i][xtag], f[e].data[i][ytag])})
-    except FileNotFoundError:
-        logger.log('error', 'Could not open the source list file.')
-        sys.exit(0)
+                colour_plot = 'C{0}'.format(order_key)
+
+            for i in range(0, len(region_data)):
+                if '!' in shapes[i]:
+                    region_list.update({'ext{}'.format(e + ':' + str(i)) : (xvalues[i], yvalues[i], colour_plot)})
+                else:
+                    region_list.update({'inc{}'.format(e + ':' + str(i)) : (xvalues[i], yvalues[i], colour_plot)})
 
     logger.log('debug', 'Energy dispersion regions collected.')
 
@@ -37,45 +37,71 @@ import warnings
 #warnings.filterwarnings("error")
 import glob
 import re
+import functools
+import concurrent.futures
 from pysas.logger import TaskLogger as TL
-from astropy import units as u
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 from astropy import constants as const
-from astropy.coordinates import Angle
 
 
 logger = TL('pyrgsspecplot')
 
+# Issue number of a CCF file, e.g. 0022 in XMM_MISCDATA_0022.CCF.
+ccf_issue_pattern = re.compile(r'\d+')
+# Radians per arcmin, the unit of DELTA_DISP and DELTA_XDSP in the source list.
+arcmin_to_radian = np.pi / 180 / 60
+# Fields returned by collect_fits_info: the keywords tried in order, the value
+# used when none of them is found and the number of digits to round to.
+fits_info_keywords = ((('OBS_ID',), 'unknown', None),
+                      (('EXP_ID',), 'unknown', None),
+                      (('TELESCOP',), 'unknown', None),
+                      (('INSTRUME',), 'unknown', None),
+                      (('DATE-OBS',), 'unknown', None),
+                      (('DATE-END',), 'unknown', None),
+                      (('OBJECT',), 'Indef', None),
+                      (('RA_OBJ', 'RA'), 'Indef', 3),
+                      (('DEC_OBJ', 'DEC'), 'Indef', 3),
+                      (('EXPIDSTR',), 'unknown', None))
+
 
 ##################################
 ######### PLOTTING UTILS #########
 ##################################
 
-def plot_spectrum(spec_data, axisunits, fits_info, t_labels, output, plot_info, beta_calc_info):
+def plot_spectrum(spec_data, axisunits, fits_info, t_labels, output, plot_info, beta_calc_info, fig = None):
     """
     Plots the given spectrum passed as a table object.
 
     Args:
-        spec_data: the table containing the data to be plotted.
+        spec_data: the table containing the data to be plotted, or a (data, errors) pair
+    of them. Dictionaries of arrays by column name are taken as tables.
         axisunits: the units to plot for the x-axis.
-        fits_info: a list containing information to add to the plot.
+        fits_info: a tuple containing information to add to the plot.
         t_labels: the labels from the table, related to spec_data.
-        output: the name of the plot file.
+        output: the name of the plot file, or the PdfPages holding all the spectra.
         plot_info: list or tuple containing basic information to show in the plots.
         beta_calc_info: information needed for the operations between Channel and wavelength.
+        fig: a figure left from a previous spectrum, to be cleared and drawn on. A new
+    figure is created if not given.
 
     Output:
         1 when finished.
     """
     
     logger.log('debug', 'Starting graph processing...')
-   
-    if dark_mode:
-        plt.style.use('dark_background')
-    else:
-        plt.style.use('default')
 
-    fig, ax1 = plt.subplots()
+    if fig is None:
+        fig, ax1 = plt.subplots()
+    else:
+        # the main axes are kept and cleared; the twin axes and the texts
+        # of the previous spectrum are removed
+        ax1 = fig.axes[0]
+        for ax in fig.axes[1:]:
+            fig.delaxes(ax)
+        for text in list(fig.texts):
+            text.remove()
+        ax1.clear()
     t_xlabel, t_ylabel, t_elabel = t_labels
 
     logger.log('debug', 'Getting passed data.')
@@ -108,8 +134,10 @@ def plot_spectrum(spec_data, axisunits, fits_info, t_labels, output, plot_info,
     text_l = 'DATE-OBS: {0}. \nDATE-END: {1}.\n{2}.\n\n'.format(date_obs, date_end, rebin_tag)
     fig.text(0.1, 0.8, text_l)
     
-    logger.log('debug', '{} {}'.format(np.nanmin(spec_data[t_xlabel].data), np.nanmax(spec_data[t_xlabel].data)))
-    ax1.set_xlim(np.nanmin(spec_data[t_xlabel].data), np.nanmax(spec_data[t_xlabel].data))
+    x_values = np.asarray(spec_data[t_xlabel])
+    x_lowest, x_highest = np.nanmin(x_values), np.nanmax(x_values)
+    logger.log('debug', '{} {}'.format(x_lowest, x_highest))
+    ax1.set_xlim(x_lowest, x_highest)
 
     if axisunits == 'rad':
         ax1.set_xlabel('BETA CHANNEL')
@@ -123,40 +151,39 @@ def plot_spectrum(spec_data, axisunits, fits_info, t_labels, output, plot_info,
         ax2 = ax1.twiny()
         ax2.set_position([0.1, 0.1, 0.8, 0.6])
         ax2.spines['top'].set_position(('axes', 1))
-        ticks = ax1.get_xticks()
-        ticks[np.where(ticks == 0)] = 1
-        lambda_val = beta2lambda(d, alpha0, ticks, order * (-1), offaxis[0])
-        
-        print('lambda_val', lambda_val)
+
         lamb_array = np.arange(39) + 1
         lamb_major = np.array((5, 10, 15, 20, 25, 30, 35, 40))
-        lamb_array_beta = lambda2beta(d, alpha0, lamb_array, order * (-1), offaxis[0])
-        lamb_major_beta = lambda2beta(d, alpha0, lamb_major, order * (-1), offaxis[0])
+        # both sets of wavelengths are converted in one call, so cos(alpha0 + offaxis)
+        # and the array set up are done once
+        lamb_beta = lambda2beta(d, alpha0, np.concatenate((lamb_array, lamb_major)), order * (-1), offaxis[0])
+        lamb_array_beta = lamb_beta[0:len(lamb_array)]
+        lamb_major_beta = lamb_beta[len(lamb_array):]
         betamin = betaref + 0.5 * betawid + original_min_channel * betawid
-        print('lambda_major:', lamb_major_beta)
         betarange = betawid * original_channel_range
-        majorpos =(lamb_major_beta - betamin) / betarange
-        labelpos = (lamb_array_beta - betamin) / betarange
-        print('betamin', betamin, 'betarange', betarange)
 
-        print('amjorpos', majorpos)
+        # energy marks, as wavelengths
+        energy_major = np.array((5, 3.5, 2.5, 2, 1.5, 1, 0.5))
+        lambda_energy_major = 12.3985 / energy_major
+        energy_values = np.linspace(4.7, 0.4, 100)
+        lambda_energy_values = 12.3985 / energy_values
+
+        # all the tick positions are scaled to the axis in a single operation
+        all_ticks = np.concatenate((lamb_major_beta, lamb_array_beta, lambda_energy_major, lambda_energy_values))
+        all_pos = (all_ticks - betamin) / betarange
+        majorpos, labelpos, energy_major_pos, energy_values_pos = np.split(all_pos,
+            np.cumsum((len(lamb_major_beta), len(lamb_array_beta), len(lambda_energy_major))))
+        logger.log('debug', 'betamin: {0}, betarange: {1}.'.format(betamin, betarange))
+
         #ax2.set_xticks(majorpos)
         ax2.xaxis.set_ticks(majorpos)
         ax2.xaxis.set_ticklabels(lamb_major)
         ax2.xaxis.set_ticks(labelpos, minor = True)
-        #ax2.set_xlim(min(lambda_val), max(lambda_val))
         ax2.set_xlabel(r"$\lambda / \AA$")
 
         # energy position in the plot
-        energy_major = np.array((5, 3.5, 2.5, 2, 1.5, 1, 0.5))
-        lambda_energy_major = 12.3985 / energy_major
-        energy_values = np.linspace(4.7, 0.4, 100)
-        lambda_energy_values = 12.3985 / energy_values
-        energy_major_pos = (lambda_energy_major - betamin) / betarange
-        energy_values_pos = (lambda_energy_values - betamin) / betarange
         ax3 = ax1.twiny()
         ax3.set_position([0.1, 0.1, 0.8, 0.6])
-        print('energy major pos:', energy_major_pos)
         ax3.spines['top'].set_position(('axes', 1.1))
         ax3.xaxis.set_ticks(energy_major_pos)
         ax3.xaxis.set_ticklabels(energy_major)
@@ -170,57 +197,23 @@ def plot_spectrum(spec_data, axisunits, fits_info, t_labels, output, plot_info,
         else:
             ax1.axhline(y = 0, color = 'black')
         #ax2.set_position([0.1, 0.1, 0.8, 0.6])
+        # only the wavelength of the ticks is drawn
         ticks = ax1.get_xticks()
-        lamb_marks = (5, 10, 15, 20, 25, 30, 35, 40)
         lamb_values = betaref + ticks * betawid
-        lambda_values = np.arange(39) + 1
-        lambda_pos = []
-        for lamb_tick in lambda_values:
-            lambda_pos.append(min(lamb_values, key=lambda x:abs(x - lamb_tick)))
         ax1.xaxis.set_ticklabels(np.around(lamb_values, 2))
-        ticks[np.where(ticks == 0)] = 1
-        energy_val = 12.3985 / lamb_values
-        #ax2.xaxis.set_ticks(ticks)
-        #ticks = ax1.get_xticks()
-        #ticks[np.where(ticks == 0)] = 1
-        #lambda_val = beta2lambda(d, alpha0, ticks, order * (-1), offaxis[0])
-
-        #lamb_array = np.arange(39) + 1
-        #lamb_major = np.array((5, 10, 15, 20, 25, 30, 35, 40))
-        #lamb_array_beta = lambda2beta(d, alpha0, lamb_array, order * (-1), offaxis[0])
-        #lamb_major_beta = lambda2beta(d, alpha0, lamb_major, order * (-1), offaxis[0])
-        #lambda_pos = []
-        #lambda_pos_minor = []
-
-        #for lamb_tick in lamb_major_beta:
-        #    lambda_pos.append(min(spec_data[t_xlabel], key=lambda x:abs(x - lamb_tick)))
-        #for lamb_tick in lamb_array_beta:
-        #    lambda_pos_minor.append(min(spec_data[t_xlabel], key=lambda x:abs(x - lamb_tick)))
-
-        #lambda_pos = np.array(lambda_pos)
-        #lambda_pos_minor = np.array(lambda_pos_minor)
-        #betamin = betaref + 0.5 * betawid + original_min_channel * betawid
-        #betarange = betawid * original_channel_range
-        #majorpos = (lambda_pos - betamin) / betarange
-        #minorpos = (lambda_pos_minor - betamin) / betarange
-        #ax1.set_xticks(majorpos)
-        #ax1.xaxis.set_ticks(majorpos)
-        #ax1.xaxis.set_ticklabels(lamb_major)
-        #ax1.xaxis.set_ticks(minorpos, minor = True)
-        #ax2 = ax1.twiny()
-
-        #ax2.set_xlim(min(lambda_val), max(lambda_val))
-        #ax2.set_xlabel('Energy / KeV')
 
     fig.set_size_inches(12, 9)
     
     fig.suptitle('pyrgsspecplot -- {0} SPECTRUM; ORDER {1}'.format(spectrumtype, order))
     
     if out_format.upper() == 'XS':
-        if os.getenv['DISPLAY']:
+        if os.environ.get('DISPLAY'):
             plt.show()
         else:
             logger.log('warning', 'Display not available.') 
+    elif isinstance(output, PdfPages):
+        logger.log('debug', 'Adding the spectrum as a page of the PDF.')
+        output.savefig(fig)
     else:
         try:
             logger.log('debug', 'Saving {}.{}.'.format(output, out_format))
@@ -250,89 +243,65 @@ def rebin_min_counts(table, min_counts, xcol, ycol, errcol = None):
         errcol: none by default. The name of the column with the errors.
     
     Output:
-        t: the rebinned table.
+        (new_t, ts): the rebinned data as steps, for the plot, and by bin. Both are
+    dictionaries of arrays by column name, which plot_spectrum takes as tables.
     """
 
     logger.log('debug', 'Running rebbin_min_counts.')
-    t = table
-    newcounts = [0] * len(t)
-    newchannel = [0] * len(t)
-    newyerror = [0] * len(t)
-    low_bin = [t[0][xcol]]
-    high_bin = []
-
-    howfar = 0 # how much of the table has been processed so far
-    k = 0 # positions in the new tabble
-    looped = 0 # number of rows a single new bin has needed to reach min_counts
-
-    while howfar < len(t):
-        howfar = howfar + looped
-        used_bins = 0 # numbins
-        runtotal = 0
-        looped = 0
-
-        for i in range(howfar, len(t)):
-            if runtotal > min_counts:
-                low_bin.append(i)
-                high_bin.append(i)
+    xvalues = np.asarray(table[xcol], dtype = np.float64)
+    yvalues = np.array(table[ycol], dtype = np.float64)
+    yvalues[np.isnan(yvalues)] = 0
+    nrows = len(yvalues)
+
+    # Each bin takes the fewest rows whose counts add up to more than
+    # min_counts; the last one runs to the end of the table. The running
+    # sums are taken over windows that grow until the bin is closed, so
+    # only the bins (not the rows) are walked in Python and negative
+    # counts are handled as well.
+    edges = [0]
+    start = 0
+    while start < nrows:
+        width = 16
+        while True:
+            above = np.flatnonzero(np.cumsum(yvalues[start:start + width]) > min_counts)
+            if len(above) > 0 or start + width >= nrows:
                 break
-            used_bins = used_bins + 1
-            if np.isnan(t[i][ycol]):
-                t[i][ycol] = 0
-                t[i][errcol] = 0
-            runtotal = runtotal + t[i][ycol]
-            newchannel[k] = newchannel[k] + t[i][xcol]
-            newcounts[k] = newcounts[k] + t[i][ycol]
-            looped = looped + 1
-       
-        if k < len(t) - 1:
-            try:
-                newchannel[k] = newchannel[k] / used_bins
-                newcounts[k] = newcounts[k] / used_bins
-            except ZeroDivisionError:
-                newchannel[k] = newchannel[k] / 1
-                newcounts[k] = newcounts[k] / 1
-            newyerror[k] = np.sqrt(abs(newcounts[k]))
-            k = k + 1
+            width = width * 2
+        if len(above) > 0:
+            start = start + int(above[0]) + 1
+        else:
+            start = nrows
+        edges.append(start)
 
-    #if axisunits == 'angstrom':
-     #   for j in range(0, len(newchannel)):
-      #      logger.log('debug', 'angs values: {} {} {}'.format(j, newchannel[j], (betaref + betawid * newchannel[j]) / order))
-       #     newchannel[j] = (betaref + betawid * newchannel[j]) / order
-        
+    widths = np.diff(edges)
+    newchannel = np.add.reduceat(xvalues, edges[:-1]) / widths
+    newcounts = np.add.reduceat(yvalues, edges[:-1]) / widths
 
-#    logger.log('debug', 'i data: {} {}'.format(len(low_bin), low_bin))
-    newchannel = newchannel[0:k-3]
-    newcounts = newcounts[0:k-3]
-    newyerror = newyerror[0:k-3]
-    ts = Table((newchannel, newcounts, newyerror), names = (xcol, ycol, errcol))
-    
-    #if axisunits == 'rad':
-    #    for j in range(0, len(newchannel)):
-    #        newchannel[j] = (spec_val - spec_pix * spec_delta - 0.5 * spec_delta) + newchannel[j] * spec_delta
-    
-#    logger.log('debug', 'total K: {}'.format(ts))
-    
-    
-    copy_newe = []
-    for i in newyerror:
-        copy_newe.extend([i, i])
+    # the last two bins are left out, as they might not be complete
+    nbins = max(len(widths) - 2, 0)
+    newchannel = newchannel[0:nbins]
+    newcounts = newcounts[0:nbins]
+    newyerror = np.sqrt(np.abs(newcounts))
+    ts = {xcol : newchannel, ycol : newcounts, errcol : newyerror}
 
-    low_bin.append(high_bin[-1])
+    copy_newe = np.repeat(newyerror, 2)
+    copy_newy = np.repeat(newcounts, 2)
 
-    copy_newy = []
-    for i in newcounts:
-        copy_newy.extend([i, i])
+    # first row of each bin after the first one
+    high_bin = np.asarray(edges[1:-1], dtype = np.float64)
+    low_bin = np.concatenate(([xvalues[0]], high_bin))[0:len(high_bin)]
 
     #creating a 'binning' grid for the x-axis of the plots
-    pos = [item for sublist in zip(low_bin, high_bin) for item in sublist]
+    pos = np.empty(2 * len(high_bin))
+    pos[0::2] = low_bin
+    pos[1::2] = high_bin
     
     #if axisunits == 'angstrom':
      #   for j in range(0, len(pos)):
       #      pos[j] = (betaref + betawid * pos[j]) / order
 
 
-    new_t = Table([pos[:-2], copy_newy, copy_newe], names = (xcol, ycol, errcol))
+    new_t = {xcol : pos[:-2], ycol : copy_newy, errcol : copy_newe}
 
     return new_t, ts
 
@@ -348,15 +317,7 @@ def get_more_recent_ccf(abspaths):
         the absolute path of the most recent file.
     """
 
-    maxn = 0
-    for f in abspaths:
-        f_aux = os.path.basename(f)
-        num = int(re.search(r'\d+', f_aux).group(0))
-        if num > maxn:
-            maxn = num
-            maxf = f
-
-    return maxf
+    return max(abspaths, key = lambda f: int(ccf_issue_pattern.search(os.path.basename(f)).group(0)))
 
 
 def check_xmm_misc(spec_header):
@@ -375,20 +336,12 @@ def check_xmm_misc(spec_header):
     
     instr = spec_header['INSTRUME']
 
-    d = 0
-    alpha0 = 0
-
-    try:
-        alpha0 = spec_header['RGSALPHA']
-    except KeyError:
-        alpha0 = 0
-    try:
-        d = spec_header['LINE_SEP']
-    except KeyError:
-        d = 0
+    alpha0 = spec_header.get('RGSALPHA', 0)
+    d = spec_header.get('LINE_SEP', 0)
 
+    # nothing else to look for when the spectrum has both
     if d != 0 and alpha0 != 0:
-        return d, alpha0
+        return float(d), float(alpha0)
 
     try:
         ccfpath = os.environ['SAS_CCFPATH']
@@ -396,49 +349,7 @@ def check_xmm_misc(spec_header):
         logger.log('error', 'Could not locate variable SAS_CCFPATH. Quitting...')
         sys.exit(0)
 
-    folders = ccfpath.split(':')
-
-    if len(folders) == 1:
-        xmm_ccf_file = glob.glob(os.environ['SAS_CCFPATH'] + '/XMM_MISCDATA*')
-        xmm_ccf_file = get_more_recent_ccf(xmm_ccf_file)
-        logger.log('debug', 'CCF file used: {0}.'.format(xmm_ccf_file))
-        with fits.open(xmm_ccf_file) as xmm:
-            try:
-                alpha0_data = xmm[1].data[xmm[1].data['PARM_ID'] == 'INCIDENCE_ANGLE'] 
-                alpha0 = alpha0_data[alpha0_data['INSTRUMENT_ID'] == instr.upper()]['PARM_VAL'][0]
-                alpha0_unit = alpha0_data[alpha0_data['INSTRUMENT_ID'] == instr.upper()]['PARM_UNIT'][0]
-                if alpha0_unit.lower() == 'deg':
-                    alpha0 = alpha0 * 180 / np.pi
-                d_data = xmm[1].data[xmm[1].data['PARM_ID'] == 'GRAT_LINE_DENS']
-                d = d_data[d_data['INSTRUMENT_ID'] == instr.upper()]['PARM_VAL'][0]
-            except (KeyError, IndexError) as e:
-                logger.log('warning', 'Could not locate alpha0 and d in the XMM CCF file.')
-    else:
-        xmm_ccf_list = []
-        logger.log('debug', 'List of folders found in CCF path: {0}'.format(folders))
-        for folder in folders:
-            try:
-                xmm_ccf_file = os.path.abspath(glob.glob(folder + '/XMM_MISCDATA*')[0])
-            except IndexError:
-                logger.log('debug', '{} does not contain XMM misc. data calibration file.'.format(folder))
-                continue
-            xmm_ccf_list.append(xmm_ccf_file)
-        logger.log('debug', 'Found the following XMM misc. data CCF compatible files: {0}'.format(xmm_ccf_list))
-        latest_ccf = get_more_recent_ccf(xmm_ccf_list)
-        logger.log('debug', 'CCF file used: {0}.'.format(latest_ccf))
-
-        with fits.open(latest_ccf) as xmm:
-            try:
-                alpha0_data = xmm[1].data[xmm[1].data['PARM_ID'] == 'INCIDENCE_ANGLE']
-                alpha0 = alpha0_data[alpha0_data['INSTRUMENT_ID'] == instr.upper()]['PARM_VAL'][0]
-                alpha0_unit = alpha0_data[alpha0_data['INSTRUMENT_ID'] == instr.upper()]['PARM_UNIT'][0]
-                if alpha0_unit.lower() == 'deg':
-                    logger.log('debug', 'Original alpha in degrees')
-                    alpha0 = alpha0 * np.pi / 180
-                d_data = xmm[1].data[xmm[1].data['PARM_ID'] == 'GRAT_LINE_DENS']
-                d = d_data[d_data['INSTRUMENT_ID'] == instr.upper()]['PARM_VAL'][0]
-            except (KeyError, IndexError) as e:
-                logger.log('warning', 'Could not locate d and alpha0 in the XMM CCF file.')
+    d, alpha0 = read_xmm_misc_ccf(instr, ccfpath)
 
     if alpha0 == 0 or d == 0:
         logger.log('error', 'Could not locate d or alpha0 neither in the Spectrum file or the XMM CCF file.')
@@ -448,6 +359,63 @@ def check_xmm_misc(spec_header):
     return(float(d), float(alpha0))
     
 
+@functools.lru_cache(maxsize = 8)
+def read_xmm_misc_ccf(instr, ccfpath):
+    """
+    Reads the line separation and the main angle of an instrument from the
+    most recent XMM miscellaneous data CCF file found in the CCF path. The
+    result is kept for each instrument and path, so the CCF file is read
+    once for all the spectra.
+
+    Args:
+        instr: the name of the instrument.
+        ccfpath: the value of SAS_CCFPATH, folders separated by ':'.
+
+    Output:
+        (d, alpha0): the line separation and the main angle; 0 if not found.
+    """
+
+    d = 0
+    alpha0 = 0
+
+    folders = ccfpath.split(':')
+    logger.log('debug', 'List of folders found in CCF path: {0}'.format(folders))
+
+    xmm_ccf_list = []
+    for folder in folders:
+        xmm_ccf_files = glob.glob(folder + '/XMM_MISCDATA*')
+        if len(xmm_ccf_files) == 0:
+            logger.log('debug', '{} does not contain XMM misc. data calibration file.'.format(folder))
+            continue
+        xmm_ccf_list.extend([os.path.abspath(f) for f in xmm_ccf_files])
+    logger.log('debug', 'Found the following XMM misc. data CCF compatible files: {0}'.format(xmm_ccf_list))
+
+    if len(xmm_ccf_list) == 0:
+        logger.log('warning', 'Could not find any XMM misc. data CCF file in {0}.'.format(ccfpath))
+        return d, alpha0
+
+    latest_ccf = get_more_recent_ccf(xmm_ccf_list)
+    logger.log('debug', 'CCF file used: {0}.'.format(latest_ccf))
+
+    with fits.open(latest_ccf) as xmm:
+        ccf_data = xmm[1].data
+        try:
+            # the rows are located with a single combined mask each, and
+            # only the values needed are read from them
+            instrument_rows = ccf_data['INSTRUMENT_ID'] == instr.upper()
+            alpha0_row = np.flatnonzero((ccf_data['PARM_ID'] == 'INCIDENCE_ANGLE') & instrument_rows)[0]
+            alpha0 = ccf_data['PARM_VAL'][alpha0_row]
+            if ccf_data['PARM_UNIT'][alpha0_row].lower() == 'deg':
+                logger.log('debug', 'Original alpha in degrees')
+                alpha0 = alpha0 * np.pi / 180
+            d_row = np.flatnonzero((ccf_data['PARM_ID'] == 'GRAT_LINE_DENS') & instrument_rows)[0]
+            d = ccf_data['PARM_VAL'][d_row]
+        except (KeyError, IndexError) as e:
+            logger.log('warning', 'Could not locate d and alpha0 in the XMM CCF file.')
+
+    return d, alpha0
+
+
 def beta2lambda(d, alpha0, beta_values, order, offaxis):
     """
     Return the lambda equivalence to the beta channel array in the input.
@@ -487,16 +455,10 @@ def lambda2beta(d, alpha0, lambda_values, order, offaxis):
         beta: the beta conversion.
     """
     
-    cosbeta = np.cos(alpha0 + offaxis) + order * lambda_values / d
-    
-    print('    cosbeta = np.cos(alpha0 + offaxis) + order * lambda_values / d', alpha0, offaxis, order, lambda_values, d)
-    if sasplt.is_iterable(cosbeta):
-        for i in range(0, len(cosbeta)):
-            if cosbeta[i] > 1:
-                cosbeta[i] = 0
-    else:
-        if cosbeta > 1:
-            cosbeta = 0
+    cosbeta = np.cos(alpha0 + offaxis) + order * np.asarray(lambda_values) / d
+
+    # values out of range are taken as 0, for scalars and arrays alike
+    cosbeta = np.where(cosbeta > 1, 0.0, cosbeta)
 
     beta = np.arccos(cosbeta)
 
@@ -585,28 +547,46 @@ def run(iparsdic):
         logger.log('error', 'mincounts must be greater than zero.')
         sys.exit(0)
 
+    if dark_mode:
+        plt.style.use('dark_background')
+    else:
+        plt.style.use('default')
+
+    # One figure is cleared and drawn again for each spectrum. When the plots
+    # are shown on screen each one needs a window, so a figure of its own.
+    if out_format.upper() == 'XS':
+        spectrum_figure = None
+    else:
+        spectrum_figure, ax = plt.subplots()
+
     nspec = 0
 
-    for spectrum in spectrumsets:
+    # Several spectra in PDF are written as pages of a single file while they
+    # are plotted, instead of one file each merged at the end.
+    if nspectrumsets > 1 and out_format.upper() == 'PDF':
+        pdf_name = plotfile + '.{}'.format(out_format)
+        if os.path.dirname(pdf_name):
+            os.makedirs(os.path.dirname(pdf_name), exist_ok = True)
+        spectrum_pages = PdfPages(pdf_name)
+    else:
+        spectrum_pages = None
+
+    # the files are read in threads, the reading being mostly IO, while the
+    # plots are made one after the other below
+    with concurrent.futures.ThreadPoolExecutor(max_workers = min(os.cpu_count() or 1, nspectrumsets)) as executor:
+        spectrum_reads = list(executor.map(read_spectrum, spectrumsets))
+
+    for spectrum, (spec_data, spec_columns, spec_header, exposuret, fits_info) in zip(spectrumsets, spectrum_reads):
         if nspectrumsets == 1:
             pass
         else:
             nspec = nspec + 1
             
         logger.log('info', 'Evaluating file {}.'.format(spectrum))
-        with fits.open(spectrum) as f:
-            spec_data = f[1].data
-            logger.log('debug', 'Filtering data using pyutils...')
-            spec_data = Table(spec_data)
-            # commented out in order to use nan in the binning
-            #spec_data = pyutils.filter_data(spec_data) 
-            spec_header = f[1].header
 
-        try:
-            hduclas2 = spec_header['HDUCLAS2']
-        except KeyError:
+        hduclas2 = spec_header.get('HDUCLAS2')
+        if hduclas2 is None:
             logger.log('warning', 'Keyword HDUCLAS2 missing in the spectrum file {}. Selecting BACKGROUND as default.'.format(spectrum))
-            spectrumtype = 'BACKGROUND'
         if hduclas2 == 'TOTAL':
             spectrumtype = 'SRC+BKG'
         elif hduclas2 == 'NET':
@@ -615,16 +595,11 @@ def run(iparsdic):
             spectrumtype = 'BACKGROUND'
 
         global axisunits
-        try:
-            tcuni = spec_header['TCUNI']
-        except KeyError:
-            try:
-                tcuni = spec_header['TCUNI1']
-            except KeyError:
-                logger.log('warning', 'Keyword TCUNI missing in the spectrum file {}. Selecting rad as default.'.format(spectrum))
-                tcuni = 'rad'
-                axisunits = 'BACKGROUND'
-        
+        tcuni = spec_header.get('TCUNI', spec_header.get('TCUNI1'))
+        if tcuni is None:
+            logger.log('warning', 'Keyword TCUNI missing in the spectrum file {}. Selecting rad as default.'.format(spectrum))
+            tcuni = 'rad'
+
         if tcuni == 'Angstrom':
             axisunits = 'angstrom'
         elif tcuni == 'rad':
@@ -633,26 +608,22 @@ def run(iparsdic):
             axisunits = 'rad'
 
         src_label, offaxis = get_src_label_and_offaxes(srclist, sourceid)
-        exposuret = float(pyutils.get_key_word(spectrum, 'Exposure'))
         global order
         order = spec_header['RFLORDER']
 
         global spec_delta
-        try:
-            spec_delta = spec_header['SPECDELT']
-        except KeyError:
+        spec_delta = spec_header.get('SPECDELT')
+        if spec_delta is None:
             logger.log('warning', 'SPECDELT not found')
             spec_delta = 1
         global spec_pix
-        try:
-            spec_pix = spec_header['SPECPIX']
-        except KeyError:
+        spec_pix = spec_header.get('SPECPIX')
+        if spec_pix is None:
             logger.log('warning', 'SPECPIX not found')
             spec_pix = 0
         global spec_val
-        try:
-            spec_val = spec_header['SPECVAL']
-        except KeyError:
+        spec_val = spec_header.get('SPECVAL')
+        if spec_val is None:
             logger.log('warning', 'SPECVAL not found')
             spec_val = 0
 
@@ -660,110 +631,66 @@ def run(iparsdic):
         nbins = len(spec_data)
 
         global betaref
-        try:
-            betaref = spec_header['TCRVL']
-        except KeyError:
-            try:
-                betaref = spec_header['TCRVL1']
-            except KeyError:
-                logger.log('error', 'Could not locate reference in the input file.')
-                sys.exit(0)
+        betaref = spec_header.get('TCRVL', spec_header.get('TCRVL1'))
+        if betaref is None:
+            logger.log('error', 'Could not locate reference in the input file.')
+            sys.exit(0)
         global betawid
-        try:
-            betawid = spec_header['TCDLT']
-        except KeyError:
-            try:
-                betawid = spec_header['TCDLT1']
-            except KeyError:
-                logger.log('error', 'Could not locate width reference in the input file.')
-                sys.exit(0)
-
-        channel_p = spec_data['CHANNEL']
-        xmin = sorted(channel_p)[0] - (sorted(channel_p)[2] - sorted(channel_p)[1]) / 2.0
-        xmax = sorted(channel_p)[-1] + (sorted(channel_p)[-1] - sorted(channel_p)[-2]) / 2.0
-
-        try:
-            counts_error_p = spec_data['STAT_ERR']
-        except KeyError:
-            pass
+        betawid = spec_header.get('TCDLT', spec_header.get('TCDLT1'))
+        if betawid is None:
+            logger.log('error', 'Could not locate width reference in the input file.')
+            sys.exit(0)
+
+        channel_p = np.array(spec_data['CHANNEL'])
+        # only the three lowest and the two highest channels are needed
+        lowest = np.partition(np.asarray(channel_p), (0, 1, 2))[:3]
+        highest = np.partition(np.asarray(channel_p), (-2, -1))[-2:]
+        xmin = lowest[0] - (lowest[2] - lowest[1]) / 2.0
+        xmax = highest[-1] + (highest[-1] - highest[-2]) / 2.0
 
         t_elabel = 'STAT_ERR'
         t_xlabel = 'CHANNEL'
 
-        try:
-            counts_p = spec_data['COUNTS']
+        # the errors are always worked out from the counts
+        if 'COUNTS' in spec_columns:
+            counts_p = np.array(spec_data['COUNTS'])
             t_ylabel = 'COUNTS'
-            try:
-                yerror = spec_data['STAT_ERR']
-            except KeyError:
-                yerror = np.sqrt(abs(counts_p))
-        except KeyError:
+        elif 'RATE' in spec_columns:
             logger.log('debug', 'RATE-like spectrum...')
-            try:
-                rate_p = spec_data['RATE']
-                try:
-                    counts_p = exposuret * rate_p
-                except RuntimeError:
-                    logger.log('error', '{} {}'.format(exposuret, rate_p))
-                    raise RuntimeError
-                try:
-                    yerror = np.sqrt(abs(counts_p))
-                except KeyError:
-                    yerror = np.sqrt(abs(spec_data['RATE'] * exposuret))
-                t_ylabel = 'RATE'
-            except KeyError:
-                logger.log('error', 'Could not detect either COUNTS or RATE columns in spectrum data.')
-                sys.exit(0)
-        
+            counts_p = exposuret * spec_data['RATE']
+            t_ylabel = 'RATE'
+        else:
+            logger.log('error', 'Could not detect either COUNTS or RATE columns in spectrum data.')
+            sys.exit(0)
+
         yerror = np.sqrt(abs(counts_p))
 
-        data_table = Table((channel_p, counts_p, yerror), names = (t_xlabel, t_ylabel, t_elabel))
+        data_table = Table((channel_p, counts_p, yerror), names = (t_xlabel, t_ylabel, t_elabel), copy = False)
         
         # Grouping analysis...
         if group:
-            try:
-                grouping = spec_data['GROUPING']
+            if 'GROUPING' in spec_columns:
+                grouping = np.asarray(spec_data['GROUPING'])
                 grouping_flag = True
-            except KeyError:
+            else:
                 logger.log('warning', 'Could not locate the GROUPING column in file {}.'.format(spectrum))
                 grouping_flag = False
 
             if grouping_flag:
                 logger.log('info', 'Working on grouped spectrum.')
-                total_new_bins = 0
-                bin_c = 0
-                
-                for i in range(0, nbins):
-                    if grouping[i] == 1:
-                        total_new_bins = total_new_bins + 1
-
-                summed_counts = [0] * total_new_bins
-                n_channels = [0] * total_new_bins
-                summed_channels = [0] * total_new_bins
-                
-                for i in range(1, nbins):
-                    if t_ylabel == 'COUNTS':
-                        summed_counts[bin_c] = summed_counts[bin_c] + counts_p[i - 1]
-                    elif t_ylabel == 'RATE':
-                        summed_counts[bin_c] = summed_counts[bin_c] + counts_p[i - 1]
-                    try:
-                        summed_channels[bin_c] = summed_channels[bin_c] + channel_p[i - 1]
-                        n_channels[bin_c] = n_channels[bin_c] + 1
-                    except IndexError:
-                        logger.log('error', 'An error has ocurred while trying to form the grouped channels.')
-                        sys.exit(0)
-
-                    if grouping[i] == 1:
-                        bin_c = bin_c + 1
-                
-                channel = []
-                counts = []
-               
-                channel = np.divide(summed_channels, n_channels)
-                if np.isnan(channel[-1]):
-                    channel[-1] = nbins
+                # each group starts at a row with GROUPING = 1; the rows
+                # before the first one, if any, make a group of their own
+                edges = np.flatnonzero(np.asarray(grouping) == 1)
+                if len(edges) == 0 or edges[0] != 0:
+                    edges = np.concatenate(([0], edges))
+
+                summed_counts = np.add.reduceat(np.asarray(counts_p, dtype = np.float64), edges)
+                summed_channels = np.add.reduceat(np.asarray(channel_p, dtype = np.float64), edges)
+                n_channels = np.diff(np.append(edges, nbins))
+
+                channel = summed_channels / n_channels
                 counts = summed_counts
-                y_error = np.sqrt(counts)
+                y_error = np.sqrt(np.abs(counts))
                 data_table = Table((channel, counts, y_error), names = (t_xlabel, t_ylabel, t_elabel))
 
         # Rebinning...
@@ -781,49 +708,70 @@ def run(iparsdic):
             rebin_tag = 'No rebinning'
             tstable = sasplt.TSrebin(data_table, DTin, DTout, t_xlabel, t_ylabel, t_elabel)
 
-        fits_info = collect_fits_info(spectrum)
+        fits_info = fits_info + (order, exposuret, src_label, spectrumtype, sourceid)
 
         d, alpha0 = check_xmm_misc(spec_header)
         plot_info = (rebin_tag, alpha0, d, offaxis)
-        fits_info.append(order)
-        fits_info.append(exposuret)
-        fits_info.append(src_label)
-        fits_info.append(spectrumtype)
-        fits_info.append(sourceid)
         t_labels = (t_xlabel, t_ylabel, t_elabel)
 
         beta_calc_info = spec_pix, original_min_channel, original_channel_range, spec_val, spec_delta
         
-        if nspec != 0:
-            if out_format.upper() == 'PDF':
-                save_as = plotfile + '_{0}_TEMP_SPECPLOT'.format(nspec)
-            else:
-                save_as = plotfile + '_{0}'.format(nspec)
+        if spectrum_pages is not None:
+            save_as = spectrum_pages
+        elif nspec != 0:
+            save_as = plotfile + '_{0}'.format(nspec)
         else:
             save_as = plotfile
         
-        plot_spectrum(tstable, axisunits, fits_info, t_labels, save_as, plot_info, beta_calc_info)
+        plot_spectrum(tstable, axisunits, fits_info, t_labels, save_as, plot_info, beta_calc_info, spectrum_figure)
 
+    if spectrum_figure is not None:
+        plt.close(spectrum_figure)
 
-    if nspec > 1 and out_format.upper() == 'PDF':
-        logger.log('info', 'Merging existing PDFs...')
-        pdf_files = glob.glob(plotfile + '*_TEMP_SPECPLOT.{}'.format(out_format))
-        status = sasplt.merge_pdf(pdf_files, plotfile + '.{}'.format(out_format))
-
-        if status:
-            for pdf_f in pdf_files:
-                os.remove(pdf_f)
-        else:
-            logger.log('warning', 'Failed to merge the PDFs.')
+    if spectrum_pages is not None:
+        spectrum_pages.close()
 
     t_stop = time.time()
 
     logger.log('info', 'Finished running pyrgsspecplot in {} seconds.'.format(round(t_stop - t_start, 2)))
 
 
+def read_spectrum(spectrum):
+    """
+    Reads the data and the keywords needed for the plot from a spectrum file.
+
+    Args:
+        spectrum: the spectrum fits file.
+
+    Output:
+        spec_data: the data of the spectrum extension, mapped from the file.
+        spec_columns: the column names of the spectrum extension.
+        spec_header: the header of the spectrum extension.
+        exposuret: the exposure time.
+        fits_info: the tuple of values given by collect_fits_info.
+    """
+
+    with fits.open(spectrum, memmap = True) as f:
+        # no Table is built from the whole extension; only the columns
+        # used are read from the mapped file
+        spec_data = f[1].data
+        spec_columns = f[1].columns.names
+        # commented out in order to use nan in the binning
+        #spec_data = pyutils.filter_data(spec_data) 
+        spec_header = f[1].header
+        # the keywords searched through all the headers are read from
+        # the file already open
+        exposuret = float(pyutils.get_key_word(f, 'Exposure'))
+        fits_info = collect_fits_info(f)
+
+    return spec_data, spec_columns, spec_header, exposuret, fits_info
+
+
 def get_src_label_and_offaxes(srclist, sourceid):
     """
     Returns the label and the offaxis values matching the source id from the source list.
+    The columns are kept for each source list and modification time, so the
+    file is read once for all the spectra and read again if it is rewritten.
 
     Args:
         srclist: the FITS file containing the source list info.
@@ -836,28 +784,55 @@ def get_src_label_and_offaxes(srclist, sourceid):
     
     logger.log('debug', 'Getting source label and offaxis values from {} with id {}.'.format(srclist, sourceid))
 
-    with fits.open(srclist) as f:
-        try:
-            src_label = f['SRCLIST'].data['LABEL'][sourceid - 1]
-        except (KeyError, IndexError) as e:
-            logger.log('warning', 'Could not locate label with the current source id ({0}) and source list ({1}). Switching to sourceid = 1.'.format(sourceid, srclist))
-            src_label = 'Indef'
-            sourceid = 1
-        try:
-            src_delta_disp = f['SRCLIST'].data['DELTA_DISP'][sourceid - 1]
-            src_delta_xdsp = f['SRCLIST'].data['DELTA_XDSP'][sourceid - 1]
-            src_delta_disp = Angle(src_delta_disp, u.arcminute)
-            src_delta_xdsp = Angle(src_delta_xdsp, u.arcminute)
+    labels, delta_disp, delta_xdsp = read_source_list(srclist, os.stat(srclist).st_mtime_ns)
 
-            offaxis = (src_delta_disp.radian, src_delta_xdsp.radian)
-            offaxis = (src_delta_disp.value * np.pi / 180 / 60, src_delta_xdsp.value * np.pi / 180 / 60)
-        except (KeyError, IndexError) as e:
-            logger.log('warning', 'Could not locate the offaxis values within the current source list and source id.')
-            offaxis = (0,0)
+    row = sourceid - 1
+    if labels is not None and 0 <= row < len(labels):
+        src_label = labels[row]
+    else:
+        logger.log('warning', 'Could not locate label with the current source id ({0}) and source list ({1}). Switching to sourceid = 1.'.format(sourceid, srclist))
+        src_label = 'Indef'
+        row = 0
+    if delta_disp is not None and 0 <= row < len(delta_disp):
+        offaxis = (delta_disp[row], delta_xdsp[row])
+    else:
+        logger.log('warning', 'Could not locate the offaxis values within the current source list and source id.')
+        offaxis = (0,0)
 
     return src_label, offaxis
 
 
+@functools.lru_cache(maxsize = 8)
+def read_source_list(srclist, mtime):
+    """
+    Reads the LABEL, DELTA_DISP and DELTA_XDSP columns of the source list.
+
+    Args:
+        srclist: the FITS file containing the source list info.
+        mtime: the modification time of the source list, only used as cache key.
+
+    Output:
+        labels: array with the source labels, None if not available.
+        delta_disp: array with the DELTA_DISP values in radians, None if not available.
+        delta_xdsp: array with the DELTA_XDSP values in radians, None if not available.
+    """
+
+    labels = delta_disp = delta_xdsp = None
+
+    with fits.open(srclist, memmap = True, lazy_load_hdus = True) as f:
+        # the columns are copied so they outlive the file
+        if 'SRCLIST' in f and f['SRCLIST'].data is not None:
+            src_data = f['SRCLIST'].data
+            src_columns = src_data.columns.names
+            if 'LABEL' in src_columns:
+                labels = np.array(src_data['LABEL'])
+            if 'DELTA_DISP' in src_columns and 'DELTA_XDSP' in src_columns:
+                delta_disp = np.array(src_data['DELTA_DISP']) * arcmin_to_radian
+                delta_xdsp = np.array(src_data['DELTA_XDSP']) * arcmin_to_radian
+
+    return labels, delta_disp, delta_xdsp
+
+
 def collect_fits_info(specfits):
     """
     Returns the needed information from a spectrum fits file.
@@ -871,40 +846,16 @@ def collect_fits_info(specfits):
     exp_idstr
     """
 
-    obs_id = pyutils.get_key_word(specfits, 'OBS_ID')
-    exp_id = pyutils.get_key_word(specfits, 'EXP_ID')
-    telescope = pyutils.get_key_word(specfits, 'TELESCOP')
-    instr = pyutils.get_key_word(specfits, 'INSTRUME')
-    date_obs = pyutils.get_key_word(specfits, 'DATE-OBS')
-    date_end = pyutils.get_key_word(specfits, 'DATE-END')
-    object_fits = pyutils.get_key_word(specfits, 'OBJECT')
-
-    if object_fits == 'unknown':
-        object_fits = 'Indef'
-
-    ra = pyutils.get_key_word(specfits, 'RA_OBJ')
-    if ra == 'unknown':
-        ra = pyutils.get_key_word(specfits, 'RA')
-        if ra == 'unknown':
-            ra = 'Indef'
-    try:
-        ra = round(ra, 3)
-    except TypeError:
-        pass
-
-    dec = pyutils.get_key_word(specfits, 'DEC_OBJ')
-    
-    if dec == 'unknown':
-        dec = pyutils.get_key_word(specfits, 'DEC')
-        if dec == 'unknown':
-            dec = 'Indef'
-    
-    try:
-        dec = round(dec, 3)
-    except TypeError:
-        pass
+    # all the keywords are read with the file opened once
+    keywords = [keyword for fallbacks, default, digits in fits_info_keywords for keyword in fallbacks]
+    values = dict(zip(keywords, pyutils.get_key_words(specfits, keywords, not_found_output = None)))
 
-    exp_idstr = pyutils.get_key_word(specfits, 'EXPIDSTR')
+    fits_info = []
+    for fallbacks, default, digits in fits_info_keywords:
+        value = next((values[keyword] for keyword in fallbacks if values[keyword] is not None), default)
+        if digits is not None and isinstance(value, (int, float)):
+            value = round(value, digits)
+        fits_info.append(value)
 
-    return[obs_id, exp_id, telescope, instr, date_obs, date_end, object_fits, ra, dec, exp_idstr]
+    return tuple(fits_info)
 
@@ -24,39 +24,37 @@ __version__ = f'pysasplot_utils (pysasplot_utils-{VERSION}) [{SAS_RELEASE}-{SAS_
 
 import pysas.pyutils.pyutils as pyutils
 from astropy.io import fits
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-from astropy.table import Table
 import sys
 import re
 import warnings
-import matplotlib.backends.backend_pdf
 import pickle
-from pypdf import PdfMerger
-from matplotlib.patches import Rectangle
-from matplotlib.collections import PatchCollection
+
+# matplotlib, astropy.table and pypdf are imported in the functions using
+# them, so the module stays cheap to import for the helpers
+
+# Numbers in a ds9 region shape, e.g. the 5 values of box(1.5,2,10,4.5,0).
+region_number_pattern = re.compile(r"[-+]?(?:\d*\.\d+|\d+)")
+# ds9 colours by the first three letters of their name.
+region_colours = {'RED' : 'red', 'GRE' : 'green', 'BLU' : 'blue', 'CYA' : 'cyan',
+                  'WHI' : 'white', 'MAG' : 'magenta', 'YEL' : 'yellow'}
 
 def text_plot(fits_file, extra_text = ''):
     """
     Prepares the text for the plot reading Keywords from the given FITS file.
 
     Args:
-        fits_file: the path to the FITS file.
+        fits_file: the path to the FITS file, or an already opened one.
         extra_text: additional text to add to the plot. Empty by default.
 
     Output:
         text_plot: the text as a string to be added to the plot.
     """
 
-    obs = pyutils.get_key_word(fits_file, 'OBS_ID')
-    expo = pyutils.get_key_word(fits_file, 'EXPIDSTR')
-    inst = pyutils.get_key_word(fits_file, 'INSTRUME')
-    revolut = pyutils.get_key_word(fits_file, 'REVOLUT')
-    ra = pyutils.get_key_word(fits_file, 'RA_OBJ')
-    dec = pyutils.get_key_word(fits_file, 'DEC_OBJ')
-    obj = pyutils.get_key_word(fits_file, 'OBJECT')
-    date_obs = pyutils.get_key_word(fits_file, 'DATE-OBS')
+    # all the keywords are read with the file opened once
+    obs, expo, inst, revolut, ra, dec, obj, date_obs = pyutils.get_key_words(fits_file,
+        ('OBS_ID', 'EXPIDSTR', 'INSTRUME', 'REVOLUT', 'RA_OBJ', 'DEC_OBJ', 'OBJECT', 'DATE-OBS'))
 
     text_plot = 'OBS ID: {}\nInstrument: {}\nExposure: {}\nRevolution: {}\nDate: {}\nRA & DEC: ({} {})\n\n{}'.format(obs, inst, expo, revolut, date_obs, ra, dec, extra_text)
 
@@ -137,7 +135,7 @@ def ingest_data(fits_file, in_data, label = 'label'):
 def is_iterable(py_obj):
     """
     Given a Python object, will return True or False if it's and iterable object aside
-    from string.
+    from string (or bytes).
 
     Args:
         py_obj: the object that has to be evaluated.
@@ -146,12 +144,9 @@ def is_iterable(py_obj):
         bool: whether or not is iterable.
     """
 
-    from collections.abc import Iterable
-
-    if isinstance(py_obj, Iterable) and not isinstance(py_obj, str):
-        return True
-    else:
-        return False
+    # an __iter__ lookup is cheaper than the isinstance check against the
+    # Iterable ABC, and the function is called for every item of some inputs
+    return hasattr(py_obj, '__iter__') and not isinstance(py_obj, (str, bytes))
 
 
 def get_time_deltas(fits_file, extension = 1, points = 512, x_data = 'TIME', card = 'TIMEDEL'):
@@ -171,6 +166,8 @@ def get_time_deltas(fits_file, extension = 1, points = 512, x_data = 'TIME', car
         Will return (1, 1) if the file could not be opened or if the extension
     does not contain a proper TIME data column (implying no rebinning).
     """
+
+    from astropy.table import Table
     
     if not isinstance(fits_file, Table):
         timedel = pyutils.get_key_word(fits_file, card, extension)
@@ -179,18 +176,21 @@ def get_time_deltas(fits_file, extension = 1, points = 512, x_data = 'TIME', car
 
     if isinstance(fits_file, str):
         try:
-            with fits.open(fits_file) as f:
-                t0 = f[extension].data[x_data][0]
-                tf = f[extension].data[x_data][-1]
-                fsize = f[extension].data.size
+            with fits.open(fits_file, memmap = True) as f:
+                # only the first and the last rows are read from the mapped file
+                time_data = f[extension].data
+                t0 = time_data[0][x_data]
+                tf = time_data[-1][x_data]
+                fsize = f[extension].header['NAXIS2']
         except FileNotFoundError:
             print('Could not locate file.')
             return (1,1)
     elif isinstance(fits_file, fits.hdu.hdulist.HDUList):
         try:
-            t0 = fits_file[extension].data[x_data][0]
-            tf = fits_file[extension].data[x_data][-1]
-            fsize = fits_file[extension].data.size
+            time_data = fits_file[extension].data
+            t0 = time_data[0][x_data]
+            tf = time_data[-1][x_data]
+            fsize = fits_file[extension].header['NAXIS2']
         except KeyError:
             print('Could not locate TIME column in data at [{0}].'.format(extension))
             return (1, 1)
@@ -226,12 +226,15 @@ def TSrebin(tstable, DTin, DTout, t_xlabel = 'TIME', t_ylabel = 'RATE', t_elabel
         ntstable: a Table object with the corrected bin size.
     """
 
+    from astropy.table import Table
+
     #
     # Check input Table Columns, in case it's been loaded as a rec array (as in ext.data)
     #
 
     if isinstance(tstable, fits.fitsrec.FITS_rec):
-        tstable = Table(tstable)
+        # the Table wraps the columns of the rec array instead of copying them
+        tstable = Table(tstable, copy = False)
 
     colNames = tstable.keys() # Input ColumnNames
     mandatoryColumns = [t_xlabel, t_ylabel, t_elabel, fracexp] # Mandatory ColumnNames
@@ -249,22 +252,12 @@ def TSrebin(tstable, DTin, DTout, t_xlabel = 'TIME', t_ylabel = 'RATE', t_elabel
     # Re-Binning of the Table 'tstable'
     #
 
-    tstable.sort(t_xlabel)
+    # the columns may be shared with the input, so instead of sorting in
+    # place a sorted copy is made, and only if the input is out of order
+    if np.any(np.diff(tstable[t_xlabel]) < 0):
+        tstable = tstable[tstable.argsort(t_xlabel)]
     ntime = tstable[t_xlabel]
-    nrate = np.nan_to_num(tstable[t_ylabel])
-    nerror = np.nan_to_num(tstable[t_elabel])
-
-    if fracexp_chk == 1:
-        fracexp = np.linspace(1, 1, len(ntime))
-    else:
-        fracexp = np.nan_to_num(tstable[fracexp])
-
-    tcum = np.nancumsum(tstable[t_xlabel])
-    rcum = np.nancumsum(nrate * fracexp) # Errors propagation are weighted by the FRACEXP from the TS
-    ecum = np.nancumsum(nerror**2 * fracexp)
-    fcum = np.nancumsum(fracexp)
-
-    nin = len(rcum) # Number of In points
+    nin = len(ntime) # Number of In points
 
     t_bin_frac = int(np.round(DTout / DTin))
 
@@ -279,21 +272,34 @@ def TSrebin(tstable, DTin, DTout, t_xlabel = 'TIME', t_ylabel = 'RATE', t_elabel
 
         #print('    Input / Output dots number       : ', nin, ' / ',nout)
 
+        # the NaN values are replaced in place in float copies of the columns,
+        # only when there is a rebinning to do
+        nrate = np.nan_to_num(np.array(tstable[t_ylabel], dtype = np.float64), copy = False)
+        nerror = np.nan_to_num(np.array(tstable[t_elabel], dtype = np.float64), copy = False)
+
+        if fracexp_chk == 1:
+            nfracexp = np.ones(nin)
+        else:
+            nfracexp = np.nan_to_num(np.array(tstable[fracexp], dtype = np.float64), copy = False)
+
+        # each output bin goes from i1 to i2, both included; the last one
+        # also takes the points left over after the last full bin
         i1 = np.arange(nout) * t_bin_frac
         i2 = np.concatenate((i1[1:] - 1, np.array([nin - 1])))
 
+        rsum = np.add.reduceat(nrate * nfracexp, i1) # Errors propagation are weighted by the FRACEXP from the TS
+        esum = np.add.reduceat(nerror**2 * nfracexp, i1)
+        fsum = np.add.reduceat(nfracexp, i1)
+
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", category = RuntimeWarning) #
+            nrate = rsum / fsum
+            nerror = np.sqrt(esum) / fsum
+            ntime = (tstable[t_xlabel][i2] + tstable[t_xlabel][i1]) / 2.
             if fracexp_chk == 0: # TS has FRACEXP column => rate and error are weighted by FRACEXP
-                nrate  = ((rcum[i2] - rcum[i1]) / (fcum[i2] - fcum[i1])    )
-                nerror = (np.sqrt(np.nan_to_num(ecum[i2] - ecum[i1])) / (fcum[i2] - fcum[i1]))
-                ntime = (tstable[t_xlabel][i2] + tstable[t_xlabel][i1]) / 2.
-                nfrac = (fcum[i2] - fcum[i1]) / (i2 - i1)
+                nfrac = fsum / (i2 - i1 + 1)
                 ntstable = Table([ntime, nrate, nerror, nfrac], names = [t_xlabel, t_ylabel, t_elabel, fracexp])
             else: # TS has NOT FRACEXP column => fracexp = 1
-                nrate  = ((rcum[i2]-rcum[i1]) / (fcum[i2] - fcum[i1])    )
-                nerror = (np.sqrt(np.nan_to_num(ecum[i2] - ecum[i1]))/(fcum[i2]-fcum[i1]))
-                ntime = (tstable[t_xlabel][i2] + tstable[t_xlabel][i1])/2.
                 ntstable = Table([ntime, nrate, nerror], names = [t_xlabel, t_ylabel, t_elabel])
 
     return ntstable
@@ -385,6 +391,8 @@ def simple_1d_hist(y_data, x_label = 'x', y_label = 'y', add_text = '', scale =
         outformat: the format (according to matplotlib. PDF by default.
     """
 
+    import matplotlib.pyplot as plt
+
     plt.style.use('ggplot')
     y_data = ingest_data(fits_file, y_data, y_label)
 
@@ -493,6 +501,9 @@ def simple_2d_plot(x_data, y_data, x_data_errors = '', y_data_errors = '', plot_
         outformat: the format for the output.
     """
 
+    import matplotlib.pyplot as plt
+    from astropy.table import Table
+
     plt.style.use('ggplot')
 
 
@@ -518,6 +529,8 @@ def simple_2d_plot(x_data, y_data, x_data_errors = '', y_data_errors = '', plot_
         x_data_key = list(x_data.keys())[0]
         x_data = list(x_data.values())[0]
 
+        # number of curves in the legend, which ends at the last curve without errors
+        legend_entries = 0
         for key in y_data.keys():
             try:
                 y_key_error = y_data_errors[key]
@@ -532,7 +545,7 @@ def simple_2d_plot(x_data, y_data, x_data_errors = '', y_data_errors = '', plot_
             if not y_error_flag and not x_error_flag:
                 try:
                     ax.plot(x_data, y_data[key], marker='.', label = str(key), linewidth = 0.8)
-                    ax.legend(bbox_to_anchor = (1.05, 1), loc = 'upper left', borderaxespad=0.)
+                    legend_entries = len(ax.get_legend_handles_labels()[0])
                 except ValueError:
                     print('Mismatching sizes for x and y: {} and {}. Omitting this curve.'.format(len(x_data), y_data[key].size))
                     continue
@@ -555,6 +568,12 @@ def simple_2d_plot(x_data, y_data, x_data_errors = '', y_data_errors = '', plot_
                     print('Mismatching between the given arrays. Key: {}.'.format(key))
                     continue
 
+        # the legend is built once, with the curves it had when it was built
+        # after each curve without errors
+        if legend_entries:
+            handles, labels = ax.get_legend_handles_labels()
+            ax.legend(handles[:legend_entries], labels[:legend_entries], bbox_to_anchor = (1.05, 1), loc = 'upper left', borderaxespad=0.)
+
     if fits_info and (isinstance(fits_file, str) or isinstance(fits_file, fits.hdu.hdulist.HDUList)):
         add_text = text_plot(fits_file, add_text)
 
@@ -675,6 +694,8 @@ def merge_pdf(pdf_files, output_file):
         1 depending on whether or not the process has been completed; 0 if not.
     """
 
+    from pypdf import PdfMerger
+
     merger = PdfMerger()
     total_files = len(pdf_files)
     e_count = 0
@@ -713,6 +734,8 @@ def plot_image(path_to_image, ext = 0, output = None):
         0 when finished.
     """
 
+    import matplotlib.pyplot as plt
+
     with fits.open(path_to_image) as img:
         img_data = img[ext].data
 
@@ -768,6 +791,9 @@ def plot_region_box(ax, x1, y1, width, height, angle = 0, fill = False, colour =
     Output:
         f_ax: the axis after plotting the box.
     '''
+
+    from matplotlib.patches import Rectangle
+    from matplotlib.collections import PatchCollection
      
     rec = Rectangle((x1, y1), width, height, angle, fill = fill, transform = transform, color = colour)
     
@@ -802,7 +828,7 @@ def reg_to_list(reg):
     
     if 'BOX' in shape_info.upper(): 
         polygon = 'BOX' 
-        x1, y1, width, heigth, angle = re.findall(r"[-+]?(?:\d*\.\d+|\d+)", shape_info)
+        x1, y1, width, heigth, angle = region_number_pattern.findall(shape_info)
         shape_info = (polygon, x1, y1, width, heigth, angle)
         
     # text details 
@@ -810,21 +836,8 @@ def reg_to_list(reg):
         colour = 'green' 
     else: 
         c_letters = shape_details[shape_details.find('COLOR') + 6 : shape_details.find('COLOR') + 9]
-        if c_letters.upper() in 'RED': 
-            colour = 'red' 
-        elif c_letters.upper() in 'GREEN': 
-            colour = 'green' 
-        elif c_letters.upper() in 'BLUE': 
-            ccolour = 'blue' 
-        elif c_letters.upper() in 'CYAN': 
-            colour = 'cyan' 
-        elif c_letters.upper() in 'WHITE':  
-            ccolour = 'white' 
-        elif c_letters.upper() in 'MAGENTA': 
-            colour = 'magenta' 
-        elif c_letters.upper() in 'YELLOW': 
-            ccolour = 'yellow' 
-        else: 
+        colour = region_colours.get(c_letters.upper())
+        if colour is None:
             warnings.warn('Colour not recognised. Using green by default') 
             colour = 'green' 
 
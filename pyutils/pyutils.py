@@ -188,6 +188,46 @@ def get_key_word(filename, keyword, extension = '', not_found_output = 'unknown'
     return not_found_output
 
 
+def get_key_words(filename, keywords, extension = '', not_found_output = 'unknown'):
+    """
+    Search a fits file for several keywords, opening the file only once.
+
+    Args:
+        filename: the path of the file to search, or an opened fits object.
+        keywords: list or tuple with the keywords.
+        extension (optional): the extension. If none is given, each keyword will be taken from the first header containing it.
+        not_found_output: the value of a keyword if it couldn't be found in the FITS file.
+
+    Output:
+        list with the values of the keywords, in the same order. not_found_output for those without a match.
+    """
+
+    if isinstance(filename, str):
+        try:
+            with fits.open(filename) as event:
+                return get_key_words(event, keywords, extension, not_found_output)
+        except FileNotFoundError:
+            return [not_found_output] * len(keywords)
+    elif isinstance(filename, fits.hdu.hdulist.HDUList):
+        if extension == '':
+            headers = [hdu.header for hdu in filename]
+        else:
+            headers = [filename[extension].header]
+    else:
+        raise FileNotFoundError('Could not determine the type of the file.')
+
+    values = []
+    for keyword in keywords:
+        value = not_found_output
+        for hdr in headers:
+            if keyword in hdr:
+                value = hdr[keyword]
+                break
+        values.append(value)
+
+    return values
+
+
 def pydump(fits_file, extension, column):
     """
     Returns the value or values of a wanted column for a fits file.